@@ -0,0 +1,104 @@
+# This file contains the benchmark suite for EmPyreAI user, group and coordinator operations.
+#
+# The suite runs against the in-memory pythoncm stand-in in FakeCMSH.py, optionally with an injected latency per
+#   round trip, at several directory sizes. Every run is appended to a JSON lines results file and compared with
+#   the previous run that used the same settings so that regressions show up next to the numbers.
+#
+# Usage:
+#   python benchmarks/BenchCMSH.py [--sizes 100,1000,10000] [--latency 0.0005] [--results benchmarks/results/cmsh.jsonl]
+#
+# Author: Kali McLennan (Flatiron Institute) - kmclennan@flatironinstitute.org
+
+import argparse
+import grp
+import os
+import sys
+import time
+
+BenchDir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BenchDir)
+sys.path.insert(0, os.path.join(os.path.dirname(BenchDir), "src"))
+
+import FakeCMSH
+import BenchUtils
+
+def Measure(func):
+    """Run func once and return (seconds, CMSH round trips)."""
+    before = sum(FakeCMSH.Counters.values())
+    start = time.perf_counter()
+    func()
+    return time.perf_counter() - start, sum(FakeCMSH.Counters.values()) - before
+
+def RunSize(size: int):
+    from EmPyreAI.EmpireUser import EmpireUser
+    from EmPyreAI.EmpireGroup import EmpireGroup
+    from EmPyreAI.EmpireCoordinator import EmpireCoordinator
+    import EmPyreAI.EmpireNotesIndex as E_NotesIndex
+
+    # The group benchmark needs a group the current user may change, so use their primary group's name
+    groupname = grp.getgrgid(os.getgid()).gr_name
+    usernames = FakeCMSH.Seed(size, groups=(groupname, "coordinator"))
+    E_NotesIndex.SharedIndex = None
+    results = {}
+    loaded = {}
+
+    def Construct():
+        for username in usernames:
+            loaded[username] = EmpireUser(username)
+    results["construct"] = Measure(Construct)
+
+    results["load_many"] = Measure(lambda: EmpireUser.LoadMany(usernames))
+
+    def NotesAccess():
+        for user in loaded.values():
+            user.Phone, user.Institution, user.PI, user.LastModified, user.Creation
+    results["notes_access"] = Measure(NotesAccess)
+
+    def Commit():
+        for user in loaded.values():
+            user.FirstName = "Changed"
+            user.Commit()
+    results["commit"] = Measure(Commit)
+
+    results["get_all"] = Measure(lambda: sum(1 for _ in EmpireUser.GetAll(("name", "notes"))))
+
+    group = EmpireGroup(groupname)
+    results["group_add_members"] = Measure(lambda: group.AddMembers(usernames, force=True))
+    results["group_set_members"] = Measure(lambda: group.SetMembers(usernames[: size // 2], force=True))
+
+    def CoordinatorFlow():
+        coordinator = EmpireCoordinator(usernames[1])
+        coordinator.EnableCoordinator()
+        coordinator.GetCoordinators()
+        coordinator.DisableCoordinator()
+        coordinator.GetCoordinators()
+    results["coordinator"] = Measure(CoordinatorFlow)
+    return results
+
+def Main():
+    parser = argparse.ArgumentParser(description="Benchmark EmPyreAI user/group operations against an in-memory CMSH.")
+    parser.add_argument("--sizes", default="100,1000,10000", help="Comma separated user counts")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds of injected latency per CMSH round trip")
+    parser.add_argument("--results", default=os.path.join(BenchDir, "results", "cmsh.jsonl"), help="JSON lines file runs are appended to")
+    parser.add_argument("--threshold", type=float, default=1.2, help="Slowdown ratio reported as a regression")
+    args = parser.parse_args()
+
+    FakeCMSH.Install(args.latency)
+    import EmPyreAI.EmpireUtils as EUtils
+    EUtils.Warning = lambda message: None # Keep per-user warnings out of the timings and the report
+
+    settings = { "latency": args.latency }
+    previous = BenchUtils.LoadPrevious(args.results, "cmsh", settings)
+    run = BenchUtils.NewRun("cmsh", settings)
+    print(f"{'scenario':<20}{'users':>8}{'seconds':>12}{'round trips':>14}{'vs previous':>14}")
+    for size in [int(s) for s in args.sizes.split(",")]:
+        for scenario, (seconds, roundTrips) in RunSize(size).items():
+            key = f"{scenario}@{size}"
+            run["results"][key] = { "seconds": seconds, "round_trips": roundTrips }
+            comparison = BenchUtils.Compare(previous, key, "seconds", seconds, args.threshold)
+            print(f"{scenario:<20}{size:>8}{seconds:>12.4f}{roundTrips:>14}{comparison:>14}")
+
+    BenchUtils.Append(args.results, run)
+
+if __name__ == "__main__":
+    Main()
@@ -0,0 +1,134 @@
+# This file contains the load-test harness for EmpireSlurm.
+#
+# A FakeSlurmrestd is started in a child process with payloads sized like a real cluster and EmpireSlurm is pointed at it.
+#   Each scenario reports requests/sec, p50/p99 latency and the peak Python memory allocated while it runs.
+#   Every run is appended to a JSON lines results file and compared with the previous run with the same settings.
+#
+# Usage:
+#   python benchmarks/BenchSlurm.py [--nodes 300] [--jobs 20000] [--users 5000] [--latency 0.002] [--requests 200]
+#
+# Author: Kali McLennan (Flatiron Institute) - kmclennan@flatironinstitute.org
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+BenchDir = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BenchDir)
+sys.path.insert(0, os.path.join(os.path.dirname(BenchDir), "src"))
+
+import BenchUtils
+from FakeSlurmrestd import FakeSlurmrestdProcess
+
+def Timed(func, repeat: int):
+    """Call func repeat times. Returns (per-call seconds, total seconds)."""
+    samples = list()
+    start = time.perf_counter()
+    for i in range(repeat):
+        callStart = time.perf_counter()
+        func(i)
+        samples.append(time.perf_counter() - callStart)
+    return samples, time.perf_counter() - start
+
+def PeakMemory(func):
+    tracemalloc.start()
+    try:
+        func(0)
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def BuildScenarios(slurm, requests: int, nodeNames):
+    from EmPyreAI.EmpireSlurm import SlurmJob, SlurmUserCache
+
+    scenarios = {}
+    def Diag(i):
+        slurm.endpoint = slurm.endpoints["diag"]
+        slurm.Get()
+    scenarios["get_diag"] = (Diag, requests, 1)
+    scenarios["get_node"] = (lambda i: slurm.GetNode(nodeNames[i % len(nodeNames)]), requests, 1)
+    scenarios["node_inventory"] = (lambda i: slurm.GetNodeInventory().GetIdleGPUNodes("gpu"), 10, 1)
+
+    cacheDir = tempfile.mkdtemp()
+    def UsersFull(i):
+        SlurmUserCache(slurm, path=os.path.join(cacheDir, f"full{i}.json")).Sync(full=True)
+    scenarios["users_full_sync"] = (UsersFull, 5, 1)
+    incremental = SlurmUserCache(slurm, path=os.path.join(cacheDir, "incremental.json"))
+    incremental.Sync(full=True)
+    scenarios["users_incremental_sync"] = (lambda i: incremental.Sync(), requests, 1)
+
+    def ParseSlurmJobs(i):
+        slurm.endpoint = slurm.endpoints["jobs"]
+        return [SlurmJob({ "jobs": [job] }) for job in slurm.Get().json()["jobs"]]
+    scenarios["jobs_slurmjob_parse"] = (ParseSlurmJobs, 3, 1)
+    try:
+        import ijson
+        scenarios["jobs_stream_parse"] = (lambda i: sum(1 for _ in slurm.IterJobs(("job_id", "job_state", "user", "partition"))), 3, 1)
+    except ImportError:
+        print("ijson is not installed; skipping jobs_stream_parse.")
+
+    try:
+        import aiohttp
+        from EmPyreAI.EmpireSlurmAsync import EmpireSlurmAsync
+        scenarios["async_node_fanout"] = (lambda i: EmpireSlurmAsync.Run(lambda client: client.GetNodes(nodeNames), 32), 3, len(nodeNames))
+    except ImportError:
+        print("aiohttp is not installed; skipping async_node_fanout.")
+    return scenarios
+
+def Main():
+    parser = argparse.ArgumentParser(description="Load test EmpireSlurm against a local fake slurmrestd.")
+    parser.add_argument("--nodes", type=int, default=300)
+    parser.add_argument("--jobs", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--job-padding", type=int, default=1024, help="Bytes of unused script text added to each job")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds the fake server delays every response")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per single-object scenario")
+    parser.add_argument("--recorded", default=None, help="Directory of recorded diag/nodes/jobs/users JSON responses")
+    parser.add_argument("--results", default=os.path.join(BenchDir, "results", "slurm.jsonl"), help="JSON lines file runs are appended to")
+    parser.add_argument("--threshold", type=float, default=1.2, help="Slowdown ratio reported as a regression")
+    args = parser.parse_args()
+
+    # The fake server runs in its own process so serving requests does not take GIL time from the client being measured
+    fake = FakeSlurmrestdProcess(nodes=args.nodes, jobs=args.jobs, users=args.users, jobPadding=args.job_padding,
+                                 latency=args.latency, recordedDir=args.recorded)
+    port = fake.Start()
+
+    # EmpireSlurm reads its token from ~/.slurmtoken, so give it a throwaway home directory
+    home = tempfile.mkdtemp()
+    with open(os.path.join(home, ".slurmtoken"), "w") as tokenFile:
+        tokenFile.write("benchmark-token\n")
+    os.environ["HOME"] = home
+
+    from EmPyreAI.EmpireSlurm import EmpireSlurm
+    EmpireSlurm.config.update({ "apiServer": "127.0.0.1", "port": port, "verbose": False })
+    slurm = EmpireSlurm()
+    nodeNames = fake.NodeNames
+
+    settings = { k: getattr(args, k) for k in ("nodes", "jobs", "users", "job_padding", "latency", "requests", "recorded") }
+    previous = BenchUtils.LoadPrevious(args.results, "slurm", settings)
+    run = BenchUtils.NewRun("slurm", settings)
+    print(f"{'scenario':<24}{'requests':>9}{'req/s':>10}{'p50 ms':>10}{'p99 ms':>10}{'peak MB':>10}{'vs previous':>14}")
+    for name, (func, repeat, requestsPerCall) in BuildScenarios(slurm, args.requests, nodeNames).items():
+        samples, total = Timed(func, repeat)
+        peak = PeakMemory(func)
+        result = {
+            "requests": repeat * requestsPerCall,
+            "requests_per_second": repeat * requestsPerCall / total,
+            "p50_seconds": BenchUtils.Percentile(samples, 0.5),
+            "p99_seconds": BenchUtils.Percentile(samples, 0.99),
+            "peak_bytes": peak
+        }
+        run["results"][name] = result
+        comparison = BenchUtils.Compare(previous, name, "requests_per_second", result["requests_per_second"], args.threshold, higherIsBetter=True)
+        print(f"{name:<24}{result['requests']:>9}{result['requests_per_second']:>10.1f}{result['p50_seconds'] * 1000:>10.2f}"
+              f"{result['p99_seconds'] * 1000:>10.2f}{peak / 1e6:>10.1f}{comparison:>14}")
+
+    slurm.Close()
+    fake.Stop()
+    BenchUtils.Append(args.results, run)
+
+if __name__ == "__main__":
+    Main()
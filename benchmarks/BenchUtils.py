@@ -0,0 +1,51 @@
+# This file contains helpers shared by the EmPyreAI benchmark suites: timing percentiles and the JSON lines
+#   results history used to compare a run with the previous one.
+#
+# Author: Kali McLennan (Flatiron Institute) - kmclennan@flatironinstitute.org
+
+import json
+import os
+import subprocess
+import time
+
+BenchDir = os.path.dirname(os.path.abspath(__file__))
+
+def GetRevision():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=BenchDir, capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+def Percentile(samples, q: float):
+    if len(samples) == 0:
+        return None
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+def NewRun(suite: str, settings: dict):
+    return { "suite": suite, "timestamp": time.strftime("%Y-%m-%d %H:%M:%S"), "revision": GetRevision(), "settings": settings, "results": {} }
+
+def LoadPrevious(resultsPath: str, suite: str, settings: dict):
+    """Return the most recent run of the same suite with identical settings, or None."""
+    if os.path.exists(resultsPath) == False:
+        return None
+    previous = None
+    with open(resultsPath) as resultsFile:
+        for line in resultsFile:
+            run = json.loads(line)
+            if run.get("suite") == suite and run.get("settings") == settings:
+                previous = run
+    return previous
+
+def Compare(previous, key: str, metric: str, value: float, threshold: float, higherIsBetter: bool = False):
+    """Describe value relative to the previous run, flagging changes worse than threshold as a regression."""
+    if previous == None or key not in previous["results"] or not previous["results"][key].get(metric):
+        return ""
+    ratio = value / previous["results"][key][metric]
+    slowdown = (1 / ratio if ratio > 0 else float("inf")) if higherIsBetter else ratio
+    return f"{ratio:.2f}x" + (" REGRESSION" if slowdown > threshold else "")
+
+def Append(resultsPath: str, run: dict):
+    os.makedirs(os.path.dirname(resultsPath), exist_ok=True)
+    with open(resultsPath, "a") as resultsFile:
+        resultsFile.write(json.dumps(run) + "\n")
@@ -0,0 +1,124 @@
+# This file contains an in-memory stand-in for the parts of Nvidia's `pythoncm` API that EmPyreAI uses.
+#
+# It provides Cluster (get_by_name, get_by_type, disconnect), Settings and the User and Group entities with a
+#   commit() method. Every call into the fake cluster and every commit sleeps for a configurable latency so
+#   benchmarks can model the round trip to Base Command. Install() must be called before EmPyreAI is imported.
+#
+# Module Functions:
+#   - Install(): Registers the fake `pythoncm` modules in sys.modules.
+#   - Seed(): Fills the shared fake cluster with users and groups.
+#
+# Author: Kali McLennan (Flatiron Institute) - kmclennan@flatironinstitute.org
+
+import json
+import sys
+import time
+import types
+
+Latency = 0.0        # Seconds slept by every fake round trip
+Store = {}           # (entity type, name) -> entity, shared by every Cluster instance
+Counters = { "get_by_name": 0, "get_by_type": 0, "commit": 0, "connect": 0 }
+
+def RoundTrip(operation):
+    Counters[operation] += 1
+    if Latency > 0:
+        time.sleep(Latency)
+
+class CommitResult:
+    def __init__(self, good):
+        self.good = good
+
+class Entity:
+    EntityType = None
+
+    def __init__(self, cluster=None):
+        self.name = None
+        self.ID = None
+
+    def commit(self):
+        RoundTrip("commit")
+        Store[(self.EntityType, self.name)] = self
+        return CommitResult(True)
+
+class User(Entity):
+    EntityType = "User"
+
+    def __init__(self, cluster=None):
+        super().__init__(cluster)
+        self.commonName = None
+        self.surname = None
+        self.email = None
+        self.notes = None
+        self.password = None
+        self.homeDirectory = None
+        self.loginShell = None
+
+class Group(Entity):
+    EntityType = "Group"
+
+    def __init__(self, cluster=None):
+        super().__init__(cluster)
+        self.members = list()
+
+class Settings:
+    def __init__(self, **kwargs):
+        self.kwargs = kwargs
+
+class Cluster:
+    def __init__(self, settings=None):
+        RoundTrip("connect")
+
+    def get_by_name(self, name, entityType):
+        RoundTrip("get_by_name")
+        return Store.get((entityType, name))
+
+    def get_by_type(self, entityType):
+        RoundTrip("get_by_type")
+        return [entity for (storedType, _), entity in Store.items() if storedType == entityType]
+
+    def disconnect(self):
+        pass
+
+def Install(latency: float = 0.0):
+    """Register the fake modules as `pythoncm`, `pythoncm.cluster`, `pythoncm.settings` and `pythoncm.entity`."""
+    global Latency
+    Latency = latency
+    package = types.ModuleType("pythoncm")
+    package.__path__ = []
+    cluster = types.ModuleType("pythoncm.cluster")
+    cluster.Cluster = Cluster
+    settings = types.ModuleType("pythoncm.settings")
+    settings.Settings = Settings
+    entity = types.ModuleType("pythoncm.entity")
+    entity.User = User
+    entity.Group = Group
+    package.cluster, package.settings, package.entity = cluster, settings, entity
+    sys.modules.update({ "pythoncm": package, "pythoncm.cluster": cluster, "pythoncm.settings": settings, "pythoncm.entity": entity })
+
+def Seed(userCount: int, groups=()):
+    """Replace the fake directory with userCount users (user00000, ...) and the named empty groups."""
+    Store.clear()
+    for key in Counters:
+        Counters[key] = 0
+    usernames = list()
+    for i in range(userCount):
+        user = User()
+        user.name = f"user{i:05d}"
+        user.ID = 100000 + i
+        user.commonName = "First"
+        user.surname = f"Last{i}"
+        user.email = f"{user.name}@example.org"
+        user.notes = json.dumps({
+            "created_by": "bench", "created_at": "2024-01-01 00:00:00",
+            "last_modified_by": "bench", "last_modified": "2024-01-01 00:00:00",
+            "phone": "212-555-0100", "institution": ["nyu", "cuny", "suny", "rpi"][i % 4], "pi": f"pi{i % 50}",
+            "is_coordinator": "True" if i % 100 == 0 else "False"
+        })
+        Store[("User", user.name)] = user
+        usernames.append(user.name)
+    for i, name in enumerate(groups):
+        group = Group()
+        group.name = name
+        group.ID = 200000 + i
+        Store[("Group", name)] = group
+    return usernames
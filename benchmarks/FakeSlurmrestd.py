@@ -0,0 +1,189 @@
+# This file contains a local stand-in for slurmrestd used to load test EmpireSlurm.
+#
+# It serves the diag, nodes, node/<name>, jobs, job/<id> and slurmdb users endpoints from synthetic payloads of a
+#   configurable size, or from recorded responses (diag.json, nodes.json, jobs.json, users.json) in a directory.
+#   Each request can be delayed by a fixed latency. Payloads are serialized once at startup so the server measures
+#   the client, not itself.
+#
+# Usage:
+#   python benchmarks/FakeSlurmrestd.py [--port 6820] [--nodes 300] [--jobs 20000] [--users 5000] [--latency 0.002]
+#
+# Class Functions:
+#   - Start(): Serves requests from a background thread. Returns the bound port.
+#   - Stop(): Shuts the server down.
+#
+# FakeSlurmrestdProcess runs the same server in a child process so it does not compete with the client under test
+#   for the GIL. Its Start() returns the bound port and NodeNames holds the names of the served nodes.
+#
+# Author: Kali McLennan (Flatiron Institute) - kmclennan@flatironinstitute.org
+
+import argparse
+import json
+import multiprocessing
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+def TimeValue(number):
+    return { "set": True, "infinite": False, "number": number }
+
+def SyntheticNode(i: int):
+    return {
+        "name": f"a{i:04d}", "state": ["IDLE"] if i % 3 else ["ALLOCATED"], "partitions": ["gpu", "all"] if i % 4 else ["cpu", "all"],
+        "features": ["h100", "ib"] if i % 4 else ["genoa"], "gres": "gpu:h100:8(S:0-1)" if i % 4 else "",
+        "gres_used": "gpu:h100:0(IDX:N/A)", "cpus": 112, "alloc_cpus": 0 if i % 3 else 112, "real_memory": 2000000,
+        "alloc_memory": 0, "architecture": "x86_64", "operating_system": "Linux 5.14", "boot_time": TimeValue(1700000000),
+        "last_busy": TimeValue(1700000000), "reason": "", "comment": "", "address": f"10.0.{i // 256}.{i % 256}"
+    }
+
+def SyntheticJob(i: int, padding: str):
+    return {
+        "job_id": 1000000 + i, "job_state": ["RUNNING"] if i % 5 else ["PENDING"], "user_name": f"user{i % 500:04d}",
+        "account": f"lab{i % 40:02d}", "partition": "gpu", "nodes": f"a{i % 300:04d}", "tres_alloc_str": "cpu=16,mem=256G,node=1,billing=16,gres/gpu=2",
+        "tres_req_str": "cpu=16,mem=256G,node=1,billing=16,gres/gpu=2", "submit_time": TimeValue(1700000000 + i),
+        "start_time": TimeValue(1700000100 + i), "end_time": TimeValue(1700086400 + i), "command": "/mnt/home/user/run.sh",
+        "current_working_directory": "/mnt/home/user", "standard_output": "/mnt/home/user/slurm-%j.out",
+        "environment": [], "script": padding, "comment": ""
+    }
+
+def SyntheticUser(i: int):
+    return {
+        "name": f"user{i:04d}", "default": { "account": f"lab{i % 40:02d}", "wckey": "" }, "administrator_level": ["None"],
+        "associations": [{ "account": f"lab{(i + k) % 40:02d}", "cluster": "alpha", "partition": "", "user": f"user{i:04d}" } for k in range(1 + i % 3)],
+        "coordinators": [], "flags": []
+    }
+
+class FakeHTTPServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128 # The default backlog of 5 stalls concurrent clients on SYN retransmits
+
+class FakeSlurmrestd:
+    def __init__(self, nodes: int = 300, jobs: int = 20000, users: int = 5000, jobPadding: int = 1024, latency: float = 0.0,
+                 recordedDir: str = None, apiVersion: str = "v0.0.39"):
+        self.latency = latency
+        self.apiVersion = apiVersion
+        self.requests = 0
+        self.server = None
+        payloads = {
+            "diag": { "statistics": { "parts_packed": 1, "req_time": TimeValue(int(time.time())) } },
+            "nodes": { "nodes": [SyntheticNode(i) for i in range(nodes)] },
+            "jobs": { "jobs": [SyntheticJob(i, "#" * jobPadding) for i in range(jobs)] },
+            "users": { "users": [SyntheticUser(i) for i in range(users)] }
+        }
+        if recordedDir != None:
+            for name in payloads:
+                path = os.path.join(recordedDir, f"{name}.json")
+                if os.path.exists(path):
+                    with open(path) as recorded:
+                        payloads[name] = json.load(recorded)
+        self.bodies = { name: json.dumps(payload).encode() for name, payload in payloads.items() }
+        self.bodies["users_since"] = json.dumps({ "users": [] }).encode()
+        self.nodeBodies = { n["name"]: json.dumps({ "nodes": [n] }).encode() for n in payloads["nodes"]["nodes"] }
+        self.jobBodies = { str(j["job_id"]): json.dumps({ "jobs": [j] }).encode() for j in payloads["jobs"]["jobs"] }
+
+    def Route(self, path: str):
+        """Return the response body for a request path, or None for 404."""
+        path, _, query = path.partition("?")
+        path = path.strip("/")
+        slurm, slurmdb = f"slurm/{self.apiVersion}/", f"slurmdb/{self.apiVersion}/"
+        if path == slurm + "diag":
+            return self.bodies["diag"]
+        if path == slurm + "nodes":
+            return self.bodies["nodes"]
+        if path.startswith(slurm + "node/"):
+            return self.nodeBodies.get(path[len(slurm + "node/"):])
+        if path == slurm + "jobs":
+            return self.bodies["jobs"]
+        if path.startswith(slurm + "job/"):
+            return self.jobBodies.get(path[len(slurm + "job/"):])
+        if path == slurmdb + "users":
+            if "update_time=" in query:
+                return self.bodies["users_since"] # Synthetic users never change after startup
+            return self.bodies["users"]
+        return None
+
+    def BuildHandler(self):
+        fake = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1" # Keep-alive, like slurmrestd
+            disable_nagle_algorithm = True # Headers and body are separate writes; don't let delayed ACKs stall them
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                fake.requests += 1
+                if fake.latency > 0:
+                    time.sleep(fake.latency)
+                body = fake.Route(self.path)
+                status = 200
+                if body == None:
+                    status, body = 404, b'{"errors": [{"error": "not found"}]}'
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+    def Start(self, port: int = 0):
+        self.server = FakeHTTPServer(("127.0.0.1", port), self.BuildHandler())
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        return self.server.server_address[1]
+
+    def Stop(self):
+        if self.server != None:
+            self.server.shutdown()
+            self.server.server_close()
+            self.server = None
+
+def Serve(connection, port: int, settings: dict):
+    fake = FakeSlurmrestd(**settings)
+    connection.send((fake.Start(port), list(fake.nodeBodies)))
+    try:
+        connection.recv() # Any message, or the parent going away, stops the server
+    except EOFError:
+        pass
+    fake.Stop()
+
+class FakeSlurmrestdProcess:
+    def __init__(self, **settings):
+        self.settings = settings
+        self.process = None
+        self.connection = None
+        self.NodeNames = None
+
+    def Start(self, port: int = 0):
+        self.connection, childConnection = multiprocessing.Pipe()
+        self.process = multiprocessing.Process(target=Serve, args=(childConnection, port, self.settings), daemon=True)
+        self.process.start()
+        port, self.NodeNames = self.connection.recv()
+        return port
+
+    def Stop(self):
+        if self.process != None:
+            self.connection.send("stop")
+            self.process.join(10)
+            self.process = None
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve synthetic or recorded slurmrestd payloads for load testing.")
+    parser.add_argument("--port", type=int, default=6820)
+    parser.add_argument("--nodes", type=int, default=300)
+    parser.add_argument("--jobs", type=int, default=20000)
+    parser.add_argument("--users", type=int, default=5000)
+    parser.add_argument("--job-padding", type=int, default=1024, help="Bytes of unused script text added to each job")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds to delay every response")
+    parser.add_argument("--recorded", default=None, help="Directory of recorded diag/nodes/jobs/users JSON responses")
+    args = parser.parse_args()
+    fake = FakeSlurmrestd(args.nodes, args.jobs, args.users, args.job_padding, args.latency, args.recorded)
+    port = fake.Start(args.port)
+    print(f"Fake slurmrestd listening on http://127.0.0.1:{port}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        fake.Stop()
@@ -1,18 +1,169 @@
+# This file owns the process-wide connection to the Base Command (CMSH) API.
+#
+# The connection is not opened at import time. It is opened on first use by
+#   any of the helpers below, kept warm for the life of the process and rebuilt
+#   automatically if a call against it fails. Close() tears it down explicitly
+#   and is also registered to run at interpreter exit.
+#
+# Module Functions:
+#   - GetCluster(): Returns the connected pythoncm Cluster, connecting if needed.
+#   - GetByName(): Wrapper around Cluster.get_by_name() that reconnects once if the connection fails.
+#   - GetAll(): Returns all entities of a given type (ex. 'User', 'Group') with the same retry behavior.
+#   - Close(): Disconnects the shared Cluster. The next call will open a new connection.
+#   - Commit(): Commits a pythoncm entity and returns its result, reconnecting once if the connection fails.
+#   - UseSnapshot(): Answers GetByName()/GetAll() from a read-only EmpireSnapshot instead of CMSH (None to undo).
+#   - IsReadOnly(): True while a snapshot is in use. Creating new entities then raises ReadOnlyError.
+#
+# For backwards compatibility `EmPyreAI.EmpireAPI.CMSH_Cluster` still resolves to the
+#   shared Cluster, but it is now connected on first access rather than at import.
+
+import atexit
 import getpass
+import http.client
+import threading
 from pythoncm.cluster import Cluster
 from pythoncm.settings import Settings
+import EmPyreAI.EmpireMetrics as EMetrics
+
+# Failures that mean the connection itself is broken (sockets, TLS, HTTP framing). Anything else raised by a call,
+#   such as a bad lookup, is passed straight to the caller without reconnecting.
+TransportErrors = (OSError, http.client.HTTPException)
+
+class CMSHConnection:
+    def __init__(self):
+        self.cluster = None
+        self.lock = threading.RLock()
+
+    def BuildSettings(self):
+        username = getpass.getuser()
+        if username == "root":
+            return None
+        return Settings(
+            host="alpha-mgr",
+            port=8081,
+            cert_file=f'/mnt/home/{username}/.empireai/cmsh_api.pem',
+            key_file=f'/mnt/home/{username}/.empireai/cmsh_api.key',
+            ca_file='/usr/lib64/python3.9/site-packages/pythoncm/etc/cacert.pem'
+        )
+
+    def Connect(self):
+        """Open a new connection to CMSH, replacing any existing one."""
+        with self.lock:
+            self.Close()
+            settings = self.BuildSettings()
+            if settings is None:
+                self.cluster = Cluster()
+            else:
+                self.cluster = Cluster(settings)
+                print("Initialized connection to CMSH_Cluster")
+            return self.cluster
+
+    def GetCluster(self):
+        """Return the shared Cluster, connecting on first use."""
+        with self.lock:
+            if self.cluster is None:
+                self.Connect()
+            return self.cluster
+
+    def Reconnect(self, failed):
+        """Replace the failed Cluster unless another thread already has, and return the Cluster to retry on."""
+        with self.lock:
+            if self.cluster is failed or self.cluster is None:
+                return self.Connect()
+            return self.cluster
+
+    def Call(self, func, retry=None):
+        """Run func(cluster) against the shared Cluster. If the connection fails, reconnect and try exactly once more
+        with retry(cluster), or func again if no retry is given."""
+        cluster = self.GetCluster()
+        try:
+            return func(cluster)
+        except TransportErrors:
+            return (retry or func)(self.Reconnect(cluster))
+
+    def Close(self):
+        with self.lock:
+            if self.cluster is not None:
+                try:
+                    self.cluster.disconnect()
+                except Exception:
+                    pass
+                self.cluster = None
+
+class ReadOnlyError(Exception):
+    """Raised when an operation needs live CMSH access while lookups are answered from a read-only snapshot."""
+    pass
+
+Connection = CMSHConnection()
+atexit.register(Connection.Close)
+ReadOnlySource = None # An EmpireSnapshot when running in offline, read-only mode
+
+def IsReadOnly():
+    return ReadOnlySource != None
+
+def UseSnapshot(snapshot):
+    global ReadOnlySource
+    ReadOnlySource = snapshot
+
+def GetCluster():
+    return Connection.GetCluster()
+
+# Every call below is timed by EmpireMetrics under the "cmsh" backend (or "snapshot" when offline).
+def GetByName(name, entityType, live=False):
+    if ReadOnlySource != None and live == False:
+        with EMetrics.Time("snapshot", "get_by_name", entityType) as call:
+            retVal = ReadOnlySource.GetByName(name, entityType)
+            call.status = "not_found" if retVal == None else "found"
+            return retVal
+    with EMetrics.Time("cmsh", "get_by_name", entityType) as call:
+        retVal = Connection.Call(lambda cluster: cluster.get_by_name(name, entityType))
+        call.status = "not_found" if retVal == None else "found"
+        return retVal
+
+def GetAll(entityType, live=False):
+    if ReadOnlySource != None and live == False:
+        with EMetrics.Time("snapshot", "get_by_type", entityType):
+            return ReadOnlySource.GetAll(entityType)
+    with EMetrics.Time("cmsh", "get_by_type", entityType):
+        return Connection.Call(lambda cluster: cluster.get_by_type(entityType))
+
+# The fields EmPyreAI edits on each entity type. They are carried over when an entity is fetched again after a reconnect.
+EditableFields = {
+    'User': ("commonName", "surname", "email", "notes", "password", "homeDirectory", "loginShell"),
+    'Group': ("members",)
+}
+
+def Refetch(entity, entityType, cluster):
+    """Return a copy of entity bound to cluster: the stored entity (or a new one, if it was never committed) with
+    every editable field that differs from the stored value copied from entity."""
+    fresh = cluster.get_by_name(entity.name, entityType)
+    if fresh == None:
+        fresh = type(entity)(cluster)
+        fresh.name = entity.name
+    for field in EditableFields.get(entityType, ()):
+        value = getattr(entity, field, None)
+        if getattr(fresh, field, None) != value:
+            setattr(fresh, field, value)
+    return fresh
+
+def Commit(entity, entityType):
+    from EmPyreAI.EmpireSnapshot import SnapshotEntity
+
+    with EMetrics.Time("cmsh", "commit", entityType) as call:
+        if isinstance(entity, SnapshotEntity):
+            result = entity.commit() # Snapshot entities refuse to commit without needing a connection
+        else:
+            # The entity is tied to the Cluster it was loaded from, so after a reconnect commit a fresh copy instead
+            result = Connection.Call(lambda cluster: entity.commit(),
+                                     lambda cluster: Refetch(entity, entityType, cluster).commit())
+        call.status = "good" if result.good else "failed"
+        return result
+
+def Close():
+    Connection.Close()
 
-CMSH_Cluster = None
-
-if getpass.getuser() != "root":
-     settings = Settings(
-        host="alpha-mgr",
-        port=8081,
-        cert_file=f'/mnt/home/{getpass.getuser()}/.empireai/cmsh_api.pem',
-        key_file=f'/mnt/home/{getpass.getuser()}/.empireai/cmsh_api.key',
-        ca_file='/usr/lib64/python3.9/site-packages/pythoncm/etc/cacert.pem'
-     )
-     CMSH_Cluster = Cluster(settings)
-     print("Initialized connection to CMSH_Cluster")
-else:
-     CMSH_Cluster = Cluster()
+def __getattr__(name):
+    # Lazily resolve the legacy module attribute without connecting at import.
+    if name == "CMSH_Cluster":
+        return Connection.GetCluster()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -8,6 +8,7 @@
 #   - user = (get) Returns an EmpireUser instance representing this user
 #
 # Class Functions:
+#   - GetCoordinators(): Returns a list of usernames in the coordinator group or flagged with the is_coordinator note
 #   - EnableCoordinator(): Set the is_coordinator note for the EmpireUser instance and add group membership
 #   - DisableCoordinator(): Set the is_coordinator note for the EmpireUser instance and remove group membership
 #
@@ -20,6 +21,7 @@
 from EmPyreAI.EmpireUser import EmpireUser
 from EmPyreAI.EmpireGroup import EmpireGroup
 import EmPyreAI.EmpireUtils as EUtils
+import EmPyreAI.EmpireNotesIndex as E_NotesIndex
 
 class EmpireCoordinator:
     def __init__(self, username):
@@ -34,8 +36,11 @@ class EmpireCoordinator:
             return False
         
     def GetCoordinators(self):
-        """This funciton will use PrettyTable to print a table listing all current coordinators on the system."""
-        return self.group.members
+        """Return a sorted list of all coordinators: members of the coordinator group and users flagged with the
+        is_coordinator note (looked up in the shared notes index rather than by decoding every user's notes)."""
+        coordinators = set(self.group.members)
+        coordinators.update(E_NotesIndex.GetIndex().GetCoordinators())
+        return sorted(coordinators)
         
     def EnableCoordinator(self):
         """This function will flag this account as a coordinator and add them to the necessary LDAP group."""
@@ -13,6 +13,8 @@
 #   - Commit(): Commits changes of group information to the Base Command API. Returns (bool).
 #   - AddMember(): Adds a member to the membership list of this group. Returns (bool).
 #   - RemoveMember(): Removes a member from the membership list of this group. Returns (bool).
+#   - AddMembers() / RemoveMembers() / SetMembers(): Apply a set difference against the current membership with one
+#       commit. Returns (dict) with the "added" and "removed" usernames and whether the change was "committed".
 #  
 # This makes use of the EmPyreAI module and ultimately the Base Command API
 #   to provide user management capabilities to coordinators without requiring
@@ -27,25 +29,28 @@ from pythoncm.entity import User
 import getpass
 import json
 import EmPyreAI.EmpireUtils as EUtils
+import EmPyreAI.EmpireMembership as EMembership
 import re
 from datetime import datetime
 import sys
-import grp
-import pwd
 
 class EmpireGroup:
   #region Constructors
-  def __init__(self, groupname):
-    """Initialize an EmpireGroup instance for the specified group."""
+  def __init__(self, groupname, groupData=None):
+    """Initialize an EmpireGroup instance for the specified group. If groupData (an already fetched pythoncm
+    Group entity) is supplied no lookup is made."""
     self.exists = False
-    self.GetFromCMD(groupname)
+    if groupData != None:
+      self.group_data = groupData
+      self.exists = True
+    else:
+      self.GetFromCMD(groupname)
   #endregion 
 
   #region Static Methods
   @staticmethod
   def Exists(groupname):
-    group_data = EmPyreAI.EmpireAPI.CMSH_Cluster.get_by_name(groupname, 'Group')
-    EmPyreAI.EmpireAPI.CMSH_Cluster.disconnect()
+    group_data = EmPyreAI.EmpireAPI.GetByName(groupname, 'Group')
     if group_data == None:
       return False
     return True
@@ -53,12 +58,7 @@ class EmpireGroup:
 
   #region Instance Methods
   def GetFromCMD(self, groupname):
-    # We need to make sure that anyone attempting to modify these groups is a member of them
-    user_groups = [g.gr_name for g in grp.getgrall() if getpass.getuser() in g.gr_mem]
-    gid = pwd.getpwnam(getpass.getuser()).pw_gid
-    user_groups.append(grp.getgrgid(gid).gr_name)
-    
-    self.group_data = EmPyreAI.EmpireAPI.CMSH_Cluster.get_by_name(groupname, 'Group')
+    self.group_data = EmPyreAI.EmpireAPI.GetByName(groupname, 'Group')
     if self.group_data == None:
       self.exists = False
       return False
@@ -70,46 +70,72 @@ class EmpireGroup:
     if self.name == "sudo":
       return False
 
-    # Get a list of groups that the current user is in
-    user_groups = [g.gr_name for g in grp.getgrall() if getpass.getuser() in g.gr_mem]
-    gid = pwd.getpwnam(getpass.getuser()).pw_gid
-    user_groups.append(grp.getgrgid(gid).gr_name)
-
-    if self.name not in user_groups:
-      return False
-    return True
+    # Anyone attempting to modify a group must be a member of it
+    return EMembership.GetIndex().IsMember(getpass.getuser(), self.name)
 
   def Commit(self):
     """Commit changes to Base Command"""
     if self.CanChange(getpass.getuser()) == False: 
       print(f"[ \033[31mERROR\033[0m ] You are not allowed to modify membership of the group \033[31m{self.name}\033[0m.")
       sys.exit(1)
-    result = self.group_data.commit()
+    result = EmPyreAI.EmpireAPI.Commit(self.group_data, 'Group')
     if result.good:
       return True
     else:
       return False
     
-  def AddMember(self, username, force=False):
+  def ChangeMembers(self, add=(), remove=(), force=False):
+    """Apply a whole membership change with a single commit.
+    Input:
+      - add: usernames to add (already present members are ignored)
+      - remove: usernames to remove (non-members are ignored)
+      - force: skip the confirmation prompt
+    Return:
+      - dict { "added": [...], "removed": [...], "committed": bool } describing what actually changed
+    """
+    current = list(self.group_data.members)
+    currentSet = set(current)
+    added = [u for u in dict.fromkeys(add) if u not in currentSet]
+    removeSet = set(remove).intersection(currentSet)
+    removed = [u for u in current if u in removeSet]
+    unchanged = { "added": [], "removed": [], "committed": False }
+
+    if len(added) == 0 and len(removed) == 0:
+      unchanged["committed"] = True # Nothing to do, membership already matches
+      return unchanged
+
     if force == False:
-      if EUtils.PromptConfirm(f"Add user \033[32m{username}\033[0m to the group \033[32m{self.name}\033[0m? (Y/N)"):
-        self.group_data.members.append(username)
-        return self.Commit()
-    else:
-      self.group_data.members.append(username)
-      return self.Commit()
-    return False
+      summary = list()
+      if len(added) > 0:
+        summary.append(f"add \033[32m{', '.join(added)}\033[0m")
+      if len(removed) > 0:
+        summary.append(f"remove \033[31m{', '.join(removed)}\033[0m")
+      if EUtils.PromptConfirm(f"In the group \033[32m{self.name}\033[0m {' and '.join(summary)}? (Y/N)") == False:
+        return unchanged
+
+    self.group_data.members = [u for u in current if u not in removeSet] + added
+    if self.Commit():
+      return { "added": added, "removed": removed, "committed": True }
+    self.group_data.members = current # Leave the local copy matching Base Command
+    return unchanged
+
+  def AddMembers(self, usernames, force=False):
+    return self.ChangeMembers(add=usernames, force=force)
+
+  def RemoveMembers(self, usernames, force=False):
+    return self.ChangeMembers(remove=usernames, force=force)
+
+  def SetMembers(self, usernames, force=False):
+    """Make the membership exactly usernames, adding and removing only the difference."""
+    usernames = list(dict.fromkeys(usernames))
+    wanted = set(usernames)
+    return self.ChangeMembers(add=usernames, remove=[u for u in self.group_data.members if u not in wanted], force=force)
 
+  def AddMember(self, username, force=False):
+    return self.AddMembers([username], force)["committed"]
 
   def RemoveMember(self, username, force=False):
-    if force == False:
-      if EUtils.PromptConfirm(f"Remove user \033[31m{username}\033[0m to the group \033[31m{self.name}\033[0m? (Y/N)"):
-        self.group_data.members.remove(username)
-        return self.Commit()
-    else:
-      self.group_data.members.remove(username)
-      return self.Commit()
-    return False
+    return self.RemoveMembers([username], force)["committed"]
   #endregion
 
   #region Getters, Setters, and property definitions
@@ -0,0 +1,140 @@
+# This file contains the EmpireJobWatch class, which follows Slurm job state and reports only what has changed.
+#
+# The watcher keeps a local table of SlurmJobRecords. Each poll passes the time of the previous poll as the
+#   update_time parameter of the jobs endpoint. update_time is not a per-job filter: slurmctld answers with an
+#   empty job list if nothing at all has changed since then, and with the complete job table otherwise. On an idle
+#   cluster polls are therefore nearly free; on a busy one most polls still transfer the whole table, but only the
+#   differences are turned into events.
+#
+# Every non-empty response is a complete snapshot, so it is compared with the table to produce JobEvents: "added"
+#   for a job seen for the first time, "changed" when any watched field differs and "finished" when a job reaches
+#   a terminal state or disappears (slurmctld purges jobs MinJobAge seconds after they end). Every fullSyncInterval
+#   seconds the job table is fetched without update_time as a safety net.
+#
+# Jobs can be limited to a set of users and/or accounts. The v0.0.39 slurmctld jobs endpoint has no user or
+#   account filter, so the filter is applied while the response is being parsed; jobs outside it are never
+#   turned into records.
+#
+# Class Functions:
+#   - Poll(): Performs one incremental (or full) poll and returns a list of JobEvents.
+#   - Watch(): Generator that polls every interval seconds and yields JobEvents as they happen.
+#   - Get(): Returns the current SlurmJobRecord for a job ID, or None.
+#
+# Example:
+#   for event in EmpireJobWatch(users=["kmclennan"]).Watch(interval=15):
+#       print(event.kind, event.job.job_id, event.job.job_state)
+#
+# Requires the ijson package (see EmpireSlurm.IterJobs).
+#
+# Author: Kali McLennan (Flatiron Institute/Simons Foundation) - kmclennan@flatironinstitute.org
+
+import time
+from EmPyreAI.EmpireSlurm import EmpireSlurm, SlurmJobRecord
+import EmPyreAI.EmpireUtils as EUtils
+
+FinishedStates = frozenset(("COMPLETED", "FAILED", "CANCELLED", "TIMEOUT", "OUT_OF_MEMORY", "NODE_FAIL",
+                            "PREEMPTED", "BOOT_FAIL", "DEADLINE", "SPECIAL_EXIT", "REVOKED"))
+
+def IsFinished(job):
+    return any(state in FinishedStates for state in job.job_state or ())
+
+class JobEvent:
+    __slots__ = ("kind", "job", "previous")
+
+    def __init__(self, kind: str, job, previous = None):
+        self.kind = kind         # "added", "changed" or "finished"
+        self.job = job           # The current SlurmJobRecord (the last one seen for jobs purged by slurmctld)
+        self.previous = previous # The SlurmJobRecord before this change, or None
+
+    def __repr__(self):
+        return f"JobEvent({self.kind}, {self.job.job_id}, {'+'.join(self.job.job_state or ())})"
+
+class EmpireJobWatch:
+    def __init__(self, slurm = None, users = None, accounts = None, fields = SlurmJobRecord.Fields,
+                 fullSyncInterval: int = 300, overlap: int = 60):
+        self.slurm = EmpireSlurm() if slurm == None else slurm
+        self.users = None if users == None else frozenset(users)
+        self.accounts = None if accounts == None else frozenset(accounts)
+        # The fields events are compared on. The ones needed to track and filter jobs are always included.
+        self.fields = tuple(dict.fromkeys(("job_id", "job_state", "user", "account") + tuple(fields)))
+        self.fullSyncInterval = fullSyncInterval
+        self.overlap = overlap # Seconds each poll reaches back so clock skew between us and slurmctld cannot drop an update
+        self.jobs = {}
+        self.lastPoll = None
+        self.lastFullSync = None
+        self.received = 0 # Jobs in the last response, before the user/account filter
+
+    def Matches(self, job):
+        """Filter applied to each raw job dict while the jobs response is streamed."""
+        self.received += 1
+        if self.users != None and job.get("user_name") not in self.users:
+            return False
+        if self.accounts != None and job.get("account") not in self.accounts:
+            return False
+        return True
+
+    def Get(self, jobID):
+        return self.jobs.get(jobID)
+
+    def GetJobs(self):
+        return self.jobs
+
+    Jobs = property(GetJobs)
+
+    def Poll(self, full: bool = False):
+        """Fetch the job table if anything changed since the last poll and return the resulting JobEvents. A failed
+        poll returns no events and is retried from the same point on the next call."""
+        now = time.time()
+        initial = self.lastPoll == None
+        if initial or self.lastFullSync == None or now - self.lastFullSync > self.fullSyncInterval:
+            full = True
+
+        additionalFields = "" if full else f"?update_time={int(self.lastPoll) - self.overlap}"
+        self.received = 0
+        try:
+            received = { job.job_id: job for job in self.slurm.IterJobs(self.fields, additionalFields, where=self.Matches) }
+        except Exception as e:
+            EUtils.Error(f"Unable to poll jobs from slurmrestd: {e}")
+            return []
+        if self.slurm.JobsStatus != 200:
+            return []
+        if full == False and self.received == 0:
+            self.lastPoll = now # slurmctld reported no change since update_time
+            return []
+
+        events = list()
+        for jobID, job in received.items():
+            previous = self.jobs.get(jobID)
+            self.jobs[jobID] = job
+            if previous == None:
+                if IsFinished(job):
+                    if initial == False:
+                        events.append(JobEvent("finished", job)) # Started and finished between two polls
+                else:
+                    events.append(JobEvent("added", job))
+            elif previous.AsTuple() != job.AsTuple():
+                if IsFinished(job) and IsFinished(previous) == False:
+                    events.append(JobEvent("finished", job, previous))
+                else:
+                    events.append(JobEvent("changed", job, previous))
+
+        # Any non-empty response is the whole job table, so jobs missing from it were purged by slurmctld
+        for jobID in self.jobs.keys() - received.keys():
+            job = self.jobs.pop(jobID)
+            if IsFinished(job) == False:
+                events.append(JobEvent("finished", job, job))
+        if full:
+            self.lastFullSync = now
+        self.lastPoll = now
+        return events
+
+    def Watch(self, interval: float = 15, maxPolls: int = None):
+        """Poll every interval seconds and yield each JobEvent. Runs forever unless maxPolls is given."""
+        polls = 0
+        while maxPolls == None or polls < maxPolls:
+            started = time.time()
+            for event in self.Poll():
+                yield event
+            polls += 1
+            if maxPolls == None or polls < maxPolls:
+                time.sleep(max(0, interval - (time.time() - started)))
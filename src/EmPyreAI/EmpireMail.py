@@ -0,0 +1,156 @@
+# This file contains the EmpireMailer class used to send email (such as welcome notices) to users.
+#
+# Jinja2 templates are compiled once per process and cached. A mailer keeps one SMTP session open and sends
+#   many messages over it, reconnecting after every `batchSize` messages or if the server drops the connection.
+#   Bulk sends return a result for every recipient instead of stopping at the first failure.
+#
+# Class Functions:
+#   - Send(): Sends one HTML message. Returns (bool, str) - success and an error description.
+#   - SendMany(): Sends a list of (to, subject, html) tuples. Returns a list of per-recipient result dicts.
+#   - SendWelcomeEmails(): Renders and sends the new user welcome email to a list of EmpireUser objects.
+#   - Close(): Closes the SMTP session.
+#
+# Static Functions:
+#   - GetTemplate(): Returns a compiled (and cached) jinja2 template from the template directory.
+#
+# Module Functions:
+#   - GetMailer(): Returns the shared EmpireMailer for this process.
+#
+# Author: Kali McLennan (Flatiron Institute) - kmclennan@flatironinstitute.org
+
+import atexit
+import smtplib
+import threading
+from email.mime.text import MIMEText
+from email.mime.multipart import MIMEMultipart
+
+class EmpireMailer:
+    config = {
+        "smtpServer": "alpha-mgr",
+        "smtpPort": 25,
+        "fromEmail": "help@empire-ai.org",
+        "templateDir": "/opt/EmpireAI-Tools/templates",
+        "welcomeTemplate": "new_user_email.template",
+        "welcomeSubject": "Empire AI Alpha Account Creation Notice",
+        "batchSize": 50 # Messages sent over one SMTP session before it is recycled
+    }
+    Environments = {} # templateDir -> jinja2.Environment
+    Templates = {}    # (templateDir, name) -> compiled template
+    TemplateLock = threading.Lock()
+
+    def __init__(self, smtpServer: str = None, smtpPort: int = None, batchSize: int = None):
+        self.smtpServer = smtpServer if smtpServer != None else self.config["smtpServer"]
+        self.smtpPort = smtpPort if smtpPort != None else self.config["smtpPort"]
+        self.batchSize = batchSize if batchSize != None else self.config["batchSize"]
+        self.smtp = None
+        self.sentOnSession = 0
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.Close()
+
+    #region Templates
+    @staticmethod
+    def GetTemplate(name: str, templateDir: str = None):
+        import jinja2
+
+        if templateDir == None:
+            templateDir = EmpireMailer.config["templateDir"]
+        with EmpireMailer.TemplateLock:
+            if (templateDir, name) not in EmpireMailer.Templates:
+                if templateDir not in EmpireMailer.Environments:
+                    EmpireMailer.Environments[templateDir] = jinja2.Environment(loader=jinja2.FileSystemLoader(templateDir))
+                EmpireMailer.Templates[(templateDir, name)] = EmpireMailer.Environments[templateDir].get_template(name)
+            return EmpireMailer.Templates[(templateDir, name)]
+
+    def RenderWelcome(self, user):
+        template = EmpireMailer.GetTemplate(self.config["welcomeTemplate"])
+        return template.render(firstname=user.FirstName, username=user.Username, institution=user.Institution)
+    #endregion
+
+    #region SMTP Session
+    def Connect(self):
+        self.Close()
+        self.smtp = smtplib.SMTP(self.smtpServer, self.smtpPort)
+        self.sentOnSession = 0
+
+    def Close(self):
+        if self.smtp != None:
+            try:
+                self.smtp.quit()
+            except smtplib.SMTPException:
+                pass
+            except OSError:
+                pass
+            self.smtp = None
+
+    def BuildMessage(self, to: str, subject: str, html: str):
+        message = MIMEMultipart("alternative")
+        message["From"] = self.config["fromEmail"]
+        message["To"] = to
+        message["Subject"] = subject
+        message.attach(MIMEText(html, "html"))
+        return message
+
+    def Send(self, to: str, subject: str, html: str):
+        """Send one message over the shared session, reconnecting once if the server dropped it."""
+        message = self.BuildMessage(to, subject, html).as_string()
+        with self.lock:
+            for attempt in (0, 1):
+                try:
+                    if self.smtp == None or self.sentOnSession >= self.batchSize:
+                        self.Connect()
+                    refused = self.smtp.sendmail(self.config["fromEmail"], to, message)
+                    self.sentOnSession += 1
+                    if len(refused) > 0:
+                        return False, str(refused)
+                    return True, ""
+                except smtplib.SMTPRecipientsRefused as e:
+                    return False, str(e.recipients)
+                except smtplib.SMTPServerDisconnected as e:
+                    self.smtp = None
+                    if attempt == 1:
+                        return False, str(e)
+                except (smtplib.SMTPException, OSError) as e:
+                    # Anything else is specific to this message (or the server is unreachable); reset and report it
+                    self.Close()
+                    return False, str(e)
+
+    def SendMany(self, messages):
+        """messages is an iterable of (to, subject, html). Returns [{"to": str, "sent": bool, "message": str}, ...]."""
+        results = list()
+        for to, subject, html in messages:
+            sent, error = self.Send(to, subject, html)
+            results.append({ "to": to, "sent": sent, "message": error })
+        return results
+    #endregion
+
+    #region Welcome Emails
+    def SendWelcomeEmails(self, users):
+        """Render and send the welcome email for every EmpireUser in users. Returns per-recipient result dicts."""
+        results = list()
+        for user in users:
+            try:
+                html = self.RenderWelcome(user)
+            except Exception as e:
+                results.append({ "to": user.Email, "sent": False, "message": f"Template error: {e}" })
+                continue
+            sent, error = self.Send(user.Email, self.config["welcomeSubject"], html)
+            results.append({ "to": user.Email, "sent": sent, "message": error })
+        return results
+    #endregion
+
+SharedMailer = None
+SharedMailerLock = threading.Lock()
+
+def GetMailer():
+    """Return the process-wide EmpireMailer. Its SMTP session is closed at exit."""
+    global SharedMailer
+    with SharedMailerLock:
+        if SharedMailer == None:
+            SharedMailer = EmpireMailer()
+            atexit.register(SharedMailer.Close)
+        return SharedMailer
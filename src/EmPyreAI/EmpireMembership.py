@@ -0,0 +1,102 @@
+# This file contains the EmpireMembershipIndex class, a process-wide index of POSIX group membership.
+#
+# Every lookup of group membership through NSS (grp.getgrall) enumerates the whole directory when SSSD/LDAP
+#   is behind it. This index performs that enumeration once, keeps the result for a configurable TTL and then
+#   answers membership questions with dictionary/set lookups.
+#
+# Class Functions:
+#   - Refresh(): Rebuilds the index from a single grp.getgrall() enumeration.
+#   - GetGroups(): Returns the set of group names a user belongs to, including their primary group.
+#   - GetMembers(): Returns the set of usernames listed as supplementary members of a group.
+#   - IsMember(): Returns bool. True if the user belongs to the group.
+#
+# Module Functions:
+#   - GetIndex(): Returns the shared EmpireMembershipIndex instance for this process.
+#
+# Author: Kali McLennan (Flatiron Institute) - kmclennan@flatironinstitute.org
+
+import grp
+import pwd
+import threading
+import time
+
+class EmpireMembershipIndex:
+    def __init__(self, ttl: int = 300):
+        """ttl is the number of seconds an enumeration is trusted before it is rebuilt."""
+        self.ttl = ttl
+        self.lock = threading.Lock()
+        self.builtAt = None
+        self.userGroups = {}    # username -> set of supplementary group names
+        self.groupMembers = {}  # group name -> set of usernames
+        self.gidNames = {}      # gid -> group name
+        self.primaryGroups = {} # username -> primary group name, resolved on demand
+
+    def IsStale(self):
+        return self.builtAt == None or (time.monotonic() - self.builtAt) > self.ttl
+
+    def Refresh(self, force: bool = False):
+        """Rebuild the index from one enumeration of the group database if it is stale (or if force is True)."""
+        with self.lock:
+            if force == False and self.IsStale() == False:
+                return
+            userGroups = {}
+            groupMembers = {}
+            gidNames = {}
+            for group in grp.getgrall():
+                gidNames[group.gr_gid] = group.gr_name
+                members = set(group.gr_mem)
+                groupMembers[group.gr_name] = members
+                for member in members:
+                    userGroups.setdefault(member, set()).add(group.gr_name)
+            self.userGroups = userGroups
+            self.groupMembers = groupMembers
+            self.gidNames = gidNames
+            self.primaryGroups = {}
+            self.builtAt = time.monotonic()
+
+    def GetPrimaryGroup(self, username: str):
+        if username not in self.primaryGroups:
+            try:
+                gid = pwd.getpwnam(username).pw_gid
+            except KeyError:
+                self.primaryGroups[username] = None
+                return None
+            name = self.gidNames.get(gid)
+            if name == None:
+                try:
+                    name = grp.getgrgid(gid).gr_name
+                except KeyError:
+                    name = None
+            self.primaryGroups[username] = name
+        return self.primaryGroups[username]
+
+    def GetGroups(self, username: str):
+        """Return the set of group names the user belongs to, including their primary group."""
+        self.Refresh()
+        retVal = set(self.userGroups.get(username, ()))
+        primary = self.GetPrimaryGroup(username)
+        if primary != None:
+            retVal.add(primary)
+        return retVal
+
+    def GetMembers(self, groupname: str):
+        """Return the set of usernames listed as members of the group."""
+        self.Refresh()
+        return set(self.groupMembers.get(groupname, ()))
+
+    def IsMember(self, username: str, groupname: str):
+        self.Refresh()
+        if username in self.groupMembers.get(groupname, ()):
+            return True
+        return self.GetPrimaryGroup(username) == groupname
+
+SharedIndex = None
+SharedIndexLock = threading.Lock()
+
+def GetIndex():
+    """Return the process-wide EmpireMembershipIndex, creating it on first use."""
+    global SharedIndex
+    with SharedIndexLock:
+        if SharedIndex == None:
+            SharedIndex = EmpireMembershipIndex()
+        return SharedIndex
@@ -0,0 +1,157 @@
+# This file contains the EmpireMetrics class which records the latency of every backend call made by EmPyreAI.
+#
+# Calls to Base Command (get_by_name, get_by_type, commit) and to slurmrestd are timed with the operation, the
+#   entity type or endpoint, and the outcome. Each distinct combination keeps a count, total time and a latency
+#   histogram in memory. The numbers can be exported on demand as JSON or in the Prometheus textfile format, and
+#   are written automatically at exit if the EMPYREAI_METRICS_FILE environment variable is set (a path ending in
+#   .prom gets the Prometheus format, anything else JSON).
+#
+# Class Functions:
+#   - Time(): Context manager that times the wrapped call. Set .status on the yielded object to record the outcome.
+#   - Record(): Records one observation.
+#   - ToDict() / ToJSON() / ToPrometheus(): Export the collected metrics.
+#   - Write(): Atomically writes the metrics to a file.
+#   - Reset(): Clears everything collected so far.
+#
+# Module Functions:
+#   - Time(): Shortcut for Metrics.Time() on the shared instance.
+#
+# Author: Kali McLennan (Flatiron Institute) - kmclennan@flatironinstitute.org
+
+import atexit
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+Buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+def EscapeLabel(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+class LatencyHistogram:
+    __slots__ = ("counts", "count", "total", "minimum", "maximum")
+
+    def __init__(self):
+        self.counts = [0] * (len(Buckets) + 1) # The final slot counts observations above the largest bucket
+        self.count = 0
+        self.total = 0.0
+        self.minimum = None
+        self.maximum = None
+
+    def Observe(self, seconds: float):
+        position = len(Buckets)
+        for i, bound in enumerate(Buckets):
+            if seconds <= bound:
+                position = i
+                break
+        self.counts[position] += 1
+        self.count += 1
+        self.total += seconds
+        self.minimum = seconds if self.minimum == None else min(self.minimum, seconds)
+        self.maximum = seconds if self.maximum == None else max(self.maximum, seconds)
+
+    def Quantile(self, q: float):
+        """Estimate a quantile as the upper bound of the bucket that contains it."""
+        if self.count == 0:
+            return None
+        target = q * self.count
+        seen = 0
+        for i, count in enumerate(self.counts):
+            seen += count
+            if seen >= target:
+                return Buckets[i] if i < len(Buckets) else self.maximum
+        return self.maximum
+
+class TimedCall:
+    __slots__ = ("status",)
+
+    def __init__(self):
+        self.status = "ok"
+
+class EmpireMetrics:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.series = {} # (backend, operation, target, status) -> LatencyHistogram
+
+    def Record(self, backend: str, operation: str, target: str, status, seconds: float):
+        key = (backend, operation, str(target), str(status))
+        with self.lock:
+            if key not in self.series:
+                self.series[key] = LatencyHistogram()
+            self.series[key].Observe(seconds)
+
+    @contextmanager
+    def Time(self, backend: str, operation: str, target: str):
+        call = TimedCall()
+        start = time.perf_counter()
+        try:
+            yield call
+        except BaseException:
+            call.status = "error"
+            raise
+        finally:
+            self.Record(backend, operation, target, call.status, time.perf_counter() - start)
+
+    def Reset(self):
+        with self.lock:
+            self.series = {}
+
+    #region Export
+    def ToDict(self):
+        retVal = list()
+        with self.lock:
+            for (backend, operation, target, status), histogram in sorted(self.series.items()):
+                retVal.append({
+                    "backend": backend, "operation": operation, "target": target, "status": status,
+                    "count": histogram.count, "total_seconds": histogram.total,
+                    "min_seconds": histogram.minimum, "max_seconds": histogram.maximum,
+                    "p50_seconds": histogram.Quantile(0.5), "p99_seconds": histogram.Quantile(0.99),
+                    "buckets": { str(bound): count for bound, count in zip(Buckets + ("+Inf",), histogram.counts) }
+                })
+        return retVal
+
+    def ToJSON(self):
+        return json.dumps(self.ToDict(), indent=2)
+
+    def ToPrometheus(self):
+        lines = [
+            "# HELP empyreai_backend_call_seconds Latency of EmPyreAI calls to Base Command and slurmrestd.",
+            "# TYPE empyreai_backend_call_seconds histogram"
+        ]
+        with self.lock:
+            for (backend, operation, target, status), histogram in sorted(self.series.items()):
+                labels = ",".join(f'{name}="{EscapeLabel(value)}"'
+                                  for name, value in (("backend", backend), ("operation", operation), ("target", target), ("status", status)))
+                cumulative = 0
+                for bound, count in zip(Buckets + ("+Inf",), histogram.counts):
+                    cumulative += count
+                    lines.append(f'empyreai_backend_call_seconds_bucket{{{labels},le="{bound}"}} {cumulative}')
+                lines.append(f"empyreai_backend_call_seconds_sum{{{labels}}} {histogram.total}")
+                lines.append(f"empyreai_backend_call_seconds_count{{{labels}}} {histogram.count}")
+        return "\n".join(lines) + "\n"
+
+    def Write(self, path: str):
+        """Atomically write the metrics to path. Files ending in .prom get the Prometheus textfile format."""
+        content = self.ToPrometheus() if path.endswith(".prom") else self.ToJSON()
+        tmpPath = f"{path}.{os.getpid()}.tmp"
+        with open(tmpPath, "w") as metricsFile:
+            metricsFile.write(content)
+        os.replace(tmpPath, path)
+    #endregion
+
+Metrics = EmpireMetrics()
+
+def Time(backend: str, operation: str, target: str):
+    return Metrics.Time(backend, operation, target)
+
+def WriteAtExit():
+    path = os.environ.get("EMPYREAI_METRICS_FILE")
+    if path and len(Metrics.series) > 0:
+        try:
+            Metrics.Write(path)
+        except OSError as e:
+            print(f"[\033[93m WARNING\033[0m ] Unable to write EmPyreAI metrics to {path}: {e}")
+
+atexit.register(WriteAtExit)
@@ -0,0 +1,115 @@
+# This file contains the NodeInventory class, an indexed snapshot of every node in the cluster.
+#
+# The inventory is built from a single response of the slurmrestd `nodes` endpoint (see EmpireSlurm.GetNodeInventory).
+#   Each node is stored as a slotted InventoryNode holding only the fields we query, and the inventory keeps
+#   indexes from partition, state, feature and GRES to node names so that questions such as
+#   "idle GPU nodes in partition X" are answered with set intersections instead of scans.
+#
+# Class Functions:
+#   - Get(): Returns the InventoryNode with the given name, or None.
+#   - Query(): Returns a list of InventoryNodes matching every supplied partition/state/feature/gres filter,
+#     minus nodes holding any of the states in exclude.
+#   - GetIdleGPUNodes(): Idle GPU nodes, excluding drained/down/maintenance/reserved ones, optionally limited to a partition.
+#
+# Author: Kali McLennan (Flatiron Institute/Simons Foundation) - kmclennan@flatironinstitute.org
+
+import re
+import time
+
+class InventoryNode:
+    __slots__ = ("name", "states", "partitions", "features", "gres", "cpus", "allocCpus", "memory", "allocMemory")
+
+    def __init__(self, data):
+        self.name = data["name"]
+        self.states = frozenset(s.upper() for s in AsList(data.get("state")))
+        self.partitions = tuple(AsList(data.get("partitions")))
+        self.features = tuple(AsList(data.get("features")))
+        self.gres = ParseGres(data.get("gres"))
+        self.cpus = data.get("cpus")
+        self.allocCpus = data.get("alloc_cpus")
+        self.memory = data.get("real_memory")
+        self.allocMemory = data.get("alloc_memory")
+
+    def __repr__(self):
+        return f"InventoryNode({self.name}, {'+'.join(sorted(self.states))})"
+
+def AsList(value):
+    """slurmrestd returns some node fields as lists and others as comma separated strings depending on version."""
+    if value == None:
+        return []
+    if isinstance(value, str):
+        return [v for v in value.split(",") if len(v) > 0]
+    return list(value)
+
+GresPattern = re.compile(r"([^:,(]+)(?::([^:,(]+))?:(\d+)")
+
+def ParseGres(gres):
+    """Parse a GRES string such as 'gpu:h100:8(S:0-1)' into {'gpu': 8, 'gpu:h100': 8}."""
+    retVal = {}
+    if gres == None:
+        return retVal
+    for entry in AsList(gres):
+        match = GresPattern.match(entry)
+        if match == None:
+            continue
+        name, kind, count = match.group(1), match.group(2), int(match.group(3))
+        retVal[name] = retVal.get(name, 0) + count
+        if kind != None:
+            retVal[f"{name}:{kind}"] = retVal.get(f"{name}:{kind}", 0) + count
+    return retVal
+
+# State flags that keep the scheduler from starting new jobs on a node even when its base state is IDLE
+UnschedulableStates = ("DRAIN", "DOWN", "MAINTENANCE", "RESERVED", "FAIL", "NOT_RESPONDING", "REBOOT_REQUESTED",
+                       "REBOOT_ISSUED", "POWERING_DOWN")
+
+class NodeInventory:
+    def __init__(self, data):
+        """Build the inventory from the decoded JSON body of the slurmrestd `nodes` endpoint."""
+        self.LoadedAt = time.time()
+        self.Nodes = {}
+        self.ByPartition = {}
+        self.ByState = {}
+        self.ByFeature = {}
+        self.ByGres = {}
+        for nodeData in data.get("nodes", []):
+            node = InventoryNode(nodeData)
+            self.Nodes[node.name] = node
+            for partition in node.partitions:
+                self.ByPartition.setdefault(partition, set()).add(node.name)
+            for state in node.states:
+                self.ByState.setdefault(state, set()).add(node.name)
+            for feature in node.features:
+                self.ByFeature.setdefault(feature, set()).add(node.name)
+            for gres in node.gres:
+                self.ByGres.setdefault(gres, set()).add(node.name)
+
+    def __len__(self):
+        return len(self.Nodes)
+
+    def Get(self, nodeName: str):
+        return self.Nodes.get(nodeName)
+
+    def Query(self, partition: str = None, state: str = None, feature: str = None, gres: str = None, exclude = ()):
+        """Return the nodes matching every filter that is not None and holding none of the states in exclude, sorted by name."""
+        candidates = list()
+        if partition != None:
+            candidates.append(self.ByPartition.get(partition, set()))
+        if state != None:
+            candidates.append(self.ByState.get(state.upper(), set()))
+        if feature != None:
+            candidates.append(self.ByFeature.get(feature, set()))
+        if gres != None:
+            candidates.append(self.ByGres.get(gres, set()))
+
+        if len(candidates) == 0:
+            names = self.Nodes.keys()
+        else:
+            candidates.sort(key=len) # Intersect starting from the smallest set
+            names = candidates[0].intersection(*candidates[1:])
+        for excluded in exclude:
+            names = names - self.ByState.get(excluded.upper(), set())
+        return [self.Nodes[name] for name in sorted(names)]
+
+    def GetIdleGPUNodes(self, partition: str = None):
+        """Idle GPU nodes the scheduler can actually start jobs on."""
+        return self.Query(partition=partition, state="IDLE", gres="gpu", exclude=UnschedulableStates)
@@ -0,0 +1,106 @@
+# This file contains the EmpireNotesIndex class, a process-wide index over fields stored in user notes.
+#
+# User notes are a JSON document per user, so questions such as "who are the coordinators" or "all users at
+#   institution X" would otherwise need every user's notes decoded. The index is built from one bulk pass over
+#   all CMSH users and maps each indexed field and (case-insensitive) value to the set of usernames holding it.
+#   EmpireUser.Commit() feeds every committed change back into the index so it stays current for this process.
+#
+# Indexed Fields:
+#   - is_coordinator, pi, institution, project
+#
+# Class Functions:
+#   - Build(): (Re)builds the index from one EmPyreAI.EmpireAPI.GetAll('User') call.
+#   - Update(): Re-indexes one user from their notes dict.
+#   - Find(): Returns a sorted list of usernames whose notes have field == value.
+#   - GetValues(): Returns the indexed note values for one user.
+#   - GetCoordinators(): Returns a sorted list of users flagged with is_coordinator.
+#
+# Module Functions:
+#   - GetIndex(): Returns the shared EmpireNotesIndex, building it on first use.
+#   - NotifyCommit(): Called by EmpireUser.Commit(). Updates the shared index if it has been built.
+#
+# Author: Kali McLennan (Flatiron Institute) - kmclennan@flatironinstitute.org
+
+import json
+import threading
+import time
+import EmPyreAI.EmpireAPI as E_API
+
+class EmpireNotesIndex:
+    Fields = ("is_coordinator", "pi", "institution", "project")
+
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.builtAt = None
+        self.byField = { field: {} for field in self.Fields } # field -> normalized value -> set of usernames
+        self.userValues = {}                                   # username -> { field: value as stored in the notes }
+
+    @staticmethod
+    def Normalize(value):
+        return str(value).strip().lower()
+
+    @staticmethod
+    def DecodeNotes(rawNotes):
+        if rawNotes == None or len(rawNotes) == 0:
+            return {}
+        try:
+            notes = json.loads(rawNotes)
+        except ValueError:
+            return {}
+        return notes if isinstance(notes, dict) else {}
+
+    def Build(self):
+        """Index every user's notes with a single bulk fetch of all CMSH users."""
+        with self.lock:
+            self.byField = { field: {} for field in self.Fields }
+            self.userValues = {}
+            for userData in E_API.GetAll('User'):
+                self.Update(userData.name, self.DecodeNotes(userData.notes))
+            self.builtAt = time.time()
+
+    def Remove(self, username: str):
+        with self.lock:
+            for field, value in self.userValues.pop(username, {}).items():
+                usernames = self.byField[field].get(self.Normalize(value))
+                if usernames != None:
+                    usernames.discard(username)
+
+    def Update(self, username: str, notes: dict):
+        with self.lock:
+            self.Remove(username)
+            values = { field: notes[field] for field in self.Fields if notes.get(field) not in (None, "") }
+            for field, value in values.items():
+                self.byField[field].setdefault(self.Normalize(value), set()).add(username)
+            self.userValues[username] = values
+
+    def Find(self, field: str, value):
+        if field not in self.Fields:
+            raise ValueError(f"The notes field {field} is not indexed. Indexed fields are: {', '.join(self.Fields)}")
+        with self.lock:
+            return sorted(self.byField[field].get(self.Normalize(value), ()))
+
+    def GetValues(self, username: str):
+        with self.lock:
+            return dict(self.userValues.get(username, {}))
+
+    def GetCoordinators(self):
+        return self.Find("is_coordinator", True)
+
+SharedIndex = None
+SharedIndexLock = threading.Lock()
+
+def GetIndex(maxAge: int = None):
+    """Return the process-wide EmpireNotesIndex, building it on first use or if it is older than maxAge seconds."""
+    global SharedIndex
+    with SharedIndexLock:
+        if SharedIndex == None:
+            SharedIndex = EmpireNotesIndex()
+        index = SharedIndex
+    if index.builtAt == None or (maxAge != None and time.time() - index.builtAt > maxAge):
+        index.Build()
+    return index
+
+def NotifyCommit(username: str, notes: dict):
+    """Keep the shared index current after a commit. Does nothing if the index has not been built."""
+    if SharedIndex != None and SharedIndex.builtAt != None:
+        SharedIndex.Update(username, notes)
@@ -0,0 +1,122 @@
+# This file contains the EmpireOnboarding class for creating or updating many user accounts at once.
+#
+# Rows (from a CSV file or a list of dicts) are validated up front, the matching users are resolved with a single
+#   EmpireUser.LoadMany() pass, and the Base Command commits are then issued from a bounded worker pool. A failure
+#   on one row is recorded in that row's result and does not stop the rest of the batch.
+#
+# Row Fields:
+#   - username, firstname, lastname, email (required)
+#   - phone, institution, pi, project (optional, stored in the user notes)
+#
+# Class Functions:
+#   - Validate(): Returns a list of (row number, message) for every row that cannot be onboarded.
+#   - Run(): Creates/updates every valid row. Returns a list of per-row result dicts.
+#
+# Static Functions:
+#   - ReadCSV(): Returns the rows of a CSV file as a list of dicts with lowercase keys.
+#
+# Result Dicts:
+#   { "row": int, "username": str, "status": "created" | "updated" | "skipped" | "invalid" | "failed", "message": str }
+#
+# Author: Kali McLennan (Flatiron Institute) - kmclennan@flatironinstitute.org
+
+import csv
+import re
+from concurrent.futures import ThreadPoolExecutor
+from EmPyreAI.EmpireUser import EmpireUser
+import EmPyreAI.EmpireUtils as EUtils
+
+class EmpireOnboarding:
+    RequiredFields = ("username", "firstname", "lastname", "email")
+    NoteFields = ("institution", "pi", "project")
+    UsernameRegex = r'[a-z][a-z0-9_-]*'
+
+    def __init__(self, rows, maxWorkers: int = 8, updateExisting: bool = False):
+        """rows is a list of dicts or the path of a CSV file. Existing users are skipped unless updateExisting is True."""
+        if isinstance(rows, str):
+            rows = EmpireOnboarding.ReadCSV(rows)
+        # Every value is compared and formatted as text, so dict rows holding numbers (ex. a phone of 5551234) are accepted
+        self.rows = [{ str(k).strip().lower(): (None if v == None else str(v).strip()) for k, v in row.items() } for row in rows]
+        self.maxWorkers = maxWorkers
+        self.updateExisting = updateExisting
+
+    @staticmethod
+    def ReadCSV(filePath: str):
+        with open(filePath, newline="") as csvFile:
+            return [row for row in csv.DictReader(csvFile)]
+
+    def ValidateRow(self, row):
+        """Return None if the row is valid, otherwise a message describing the problem."""
+        for field in self.RequiredFields:
+            if row.get(field) == None or len(row.get(field)) == 0:
+                return f"Missing required field '{field}'."
+        username = row["username"]
+        if len(username) < EUtils.MinimumUsernameLength or re.fullmatch(self.UsernameRegex, username) == None:
+            return f"Invalid username '{username}'."
+        if EUtils.ValidEmail(row["email"]) == False:
+            return f"Invalid email address '{row['email']}'."
+        if row.get("phone"):
+            valid, _ = EUtils.FormatPhoneNumber(row["phone"])
+            if valid == False:
+                return f"Invalid phone number '{row['phone']}'."
+        return None
+
+    def Validate(self):
+        problems = list()
+        seen = set()
+        for rowNumber, row in enumerate(self.rows):
+            try:
+                message = self.ValidateRow(row)
+            except Exception as e: # One malformed row must not stop the rest of the batch from being checked
+                message = f"Unable to validate row: {e}"
+            if message == None and row["username"] in seen:
+                message = f"Duplicate username '{row['username']}' in this batch."
+            if message != None:
+                problems.append((rowNumber, message))
+            else:
+                seen.add(row["username"])
+        return problems
+
+    def Apply(self, user, row):
+        """Copy a row onto an EmpireUser and commit it."""
+        user.FirstName = row["firstname"]
+        user.LastName = row["lastname"]
+        user.Email = row["email"]
+        if row.get("phone"):
+            user.Phone = EUtils.FormatPhoneNumber(row["phone"])[1]
+        for field in self.NoteFields:
+            if row.get(field):
+                user.SetNote(field, row[field])
+        if user.UserData.password == None:
+            user.UserData.password = EUtils.GenPassword(28)
+        return user.Commit(force=True)
+
+    def Run(self):
+        results = [None] * len(self.rows)
+        for rowNumber, message in self.Validate():
+            results[rowNumber] = { "row": rowNumber, "username": self.rows[rowNumber].get("username"), "status": "invalid", "message": message }
+
+        pending = [rowNumber for rowNumber in range(len(self.rows)) if results[rowNumber] == None]
+        users, missing = EmpireUser.LoadMany([self.rows[n]["username"] for n in pending], createMissing=True)
+        missing = set(missing)
+
+        def Worker(rowNumber):
+            row = self.rows[rowNumber]
+            username = row["username"]
+            status = "created" if username in missing else "updated"
+            if status == "updated" and self.updateExisting == False:
+                return { "row": rowNumber, "username": username, "status": "skipped", "message": "User already exists." }
+            try:
+                if self.Apply(users[username], row):
+                    return { "row": rowNumber, "username": username, "status": status, "message": "" }
+                return { "row": rowNumber, "username": username, "status": "failed", "message": "Commit to Base Command failed." }
+            except Exception as e:
+                return { "row": rowNumber, "username": username, "status": "failed", "message": str(e) }
+
+        with ThreadPoolExecutor(max_workers=self.maxWorkers) as executor:
+            for result in executor.map(Worker, pending):
+                results[result["row"]] = result
+
+        created = sum(1 for r in results if r["status"] in ("created", "updated"))
+        EUtils.Notice(f"Onboarding finished: {created} of {len(results)} rows committed.")
+        return results
@@ -14,7 +14,8 @@
 #     - ID Number (Auto increment)
 # 
 # This data will be used to generate a list of EmpireProject objects, each representing one reserach project
-#   and ultimately saved via pickle to a file on the head node.
+#   and ultimately saved to a SQLite database on the head node (EmpireProjectStore). The legacy pickle file is
+#   imported into the database once, the first time it is opened.
 #
 # This makes use of the EmPyreAI module and ultimately the Base Command API
 #   to provide user management capabilities to coordinators without requiring
@@ -23,47 +24,320 @@
 # Author: Kali McLennan (Flatiron Institute) - kmclennan@flatironinstitute.org
 
 import os
+import bisect
 import pickle
+import sqlite3
+import threading
+from contextlib import contextmanager
 import EmPyreAI.EmpireUtils as EUtils
 
+ProjectStorePath = "/opt/EmpireAI-Tools/share/projects.db"
+LegacyPicklePath = "/opt/EmpireAI-Tools/share/projects.bin"
+
+class EmpireProjectStore:
+    """SQLite-backed project storage.
+
+    Every write runs in its own IMMEDIATE transaction, so concurrent coordinators serialize on the database lock
+    instead of overwriting each other, and a crash mid-write leaves the previous state intact. Project IDs come
+    from a counter kept in the same database and are never reused.
+    """
+    Columns = ("institution", "long_title", "title", "pi", "location", "department")
+
+    def __init__(self, path: str = ProjectStorePath):
+        self.path = path
+        self.lock = threading.RLock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.connection = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS projects (
+            id INTEGER PRIMARY KEY,
+            institution TEXT, long_title TEXT, title TEXT, pi TEXT, location TEXT, department TEXT)""")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    @contextmanager
+    def Transaction(self):
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.connection
+            except:
+                self.connection.execute("ROLLBACK")
+                raise
+            self.connection.execute("COMMIT")
+
+    def GetMeta(self, db, key):
+        row = db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return None if row == None else row[0]
+
+    def SetMeta(self, db, key, value):
+        db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def NextID(self, db):
+        nextID = self.GetMeta(db, "next_id")
+        if nextID == None:
+            nextID = db.execute("SELECT COALESCE(MAX(id), 0) + 1 FROM projects").fetchone()[0]
+        nextID = int(nextID)
+        self.SetMeta(db, "next_id", nextID + 1)
+        return nextID
+
+    def AllocateID(self):
+        """Reserve and return the next project ID. Safe to call from several processes at once."""
+        with self.Transaction() as db:
+            return self.NextID(db)
+
+    def Insert(self, project):
+        """Insert a project, allocating an ID first if it does not have one."""
+        with self.Transaction() as db:
+            if project.ID == None:
+                project._id = self.NextID(db)
+            db.execute(f"INSERT INTO projects (id, {', '.join(self.Columns)}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                       (project.ID,) + project.ToRow())
+        project.MarkSaved()
+        return project.ID
+
+    def Update(self, project):
+        """Write the fields of an existing project. Returns True if the project was found."""
+        with self.Transaction() as db:
+            cursor = db.execute(f"UPDATE projects SET {', '.join(c + ' = ?' for c in self.Columns)} WHERE id = ?",
+                                project.ToRow() + (project.ID,))
+            found = cursor.rowcount == 1
+        if found:
+            project.MarkSaved()
+        return found
+
+    def SaveChanges(self, projects):
+        """Insert new projects and write edited ones in a single transaction; unchanged projects are not written.
+        An edited project is only written if its stored row still matches what was loaded. Projects whose row was
+        changed by someone else in the meantime are skipped and returned."""
+        saved, conflicts = list(), list()
+        matchLoaded = " AND ".join(c + " IS ?" for c in self.Columns)
+        with self.Transaction() as db:
+            for project in projects:
+                if project.ID == None:
+                    project._id = self.NextID(db)
+                    db.execute(f"INSERT INTO projects (id, {', '.join(self.Columns)}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                               (project.ID,) + project.ToRow())
+                elif project._dirty:
+                    cursor = db.execute(f"UPDATE projects SET {', '.join(c + ' = ?' for c in self.Columns)} WHERE id = ? AND {matchLoaded}",
+                                        project.ToRow() + (project.ID,) + project._loaded)
+                    if cursor.rowcount == 0:
+                        conflicts.append(project)
+                        continue
+                else:
+                    continue
+                saved.append(project)
+        for project in saved:
+            project.MarkSaved()
+        return conflicts
+
+    def Get(self, projectID: int):
+        row = self.connection.execute(f"SELECT id, {', '.join(self.Columns)} FROM projects WHERE id = ?", (projectID,)).fetchone()
+        return None if row == None else EmpireProject.FromRow(row)
+
+    def LoadAll(self):
+        rows = self.connection.execute(f"SELECT id, {', '.join(self.Columns)} FROM projects ORDER BY id").fetchall()
+        return [EmpireProject.FromRow(row) for row in rows]
+
+    def ImportPickle(self, filePath: str = LegacyPicklePath):
+        """One-time import of the legacy pickled project list. Returns the number of projects imported."""
+        if os.path.exists(filePath) == False:
+            return 0
+        with self.Transaction() as db:
+            if self.GetMeta(db, "pickle_imported") != None or self.GetMeta(db, "pickle_import_failed") != None:
+                return 0
+            try:
+                with open(filePath, "rb") as file:
+                    legacyProjects = pickle.load(file) or list()
+            except (EOFError, pickle.UnpicklingError, AttributeError, ImportError) as e:
+                # An empty or truncated pickle would otherwise fail every open; record it and carry on with the store
+                self.SetMeta(db, "pickle_import_failed", f"{filePath}: {e}")
+                EUtils.Warning(f"Skipping the unreadable legacy project file {filePath} ({e}). Delete the pickle_import_failed row from the meta table of {self.path} to retry the import.")
+                return 0
+            for project in legacyProjects:
+                projectID = getattr(project, "_id", None)
+                if projectID == None or db.execute("SELECT 1 FROM projects WHERE id = ?", (projectID,)).fetchone() != None:
+                    projectID = None
+                project._id = projectID if projectID != None else self.NextID(db)
+                db.execute(f"INSERT INTO projects (id, {', '.join(self.Columns)}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                           (project._id,) + EmpireProject.ToRow(project))
+            # Never hand out an ID at or below one that was imported
+            maxID = db.execute("SELECT COALESCE(MAX(id), 0) FROM projects").fetchone()[0]
+            nextID = self.GetMeta(db, "next_id")
+            if nextID == None or int(nextID) <= maxID:
+                self.SetMeta(db, "next_id", maxID + 1)
+            self.SetMeta(db, "pickle_imported", filePath)
+        EUtils.Notice(f"Imported {len(legacyProjects)} projects from {filePath}.")
+        return len(legacyProjects)
+
+DefaultStore = None
+DefaultStoreLock = threading.Lock()
+
+def GetStore():
+    """Return the process-wide EmpireProjectStore at ProjectStorePath."""
+    global DefaultStore
+    with DefaultStoreLock:
+        if DefaultStore == None:
+            DefaultStore = EmpireProjectStore()
+        return DefaultStore
+
 class EmpireProjectList:
-    def __init__(self):
+    """All projects, with indexes by ID, PI, institution and department and prefix/substring search over titles.
+    The indexes are kept in sync as projects are added to the list or edited through their properties."""
+    IndexedFields = ("pi", "institution", "department")
+
+    def __init__(self, store: EmpireProjectStore = None):
+        self.Store = store
         self.LoadProjects()
 
-    def LoadProjects(self):
-        filePath = "/opt/EmpireAI-Tools/share/projects.bin"
-        if os.path.exists(filePath):
-            with open(filePath, "rb") as file:
-                try:
-                    self.Projects = pickle.load(file)
-                    return True
-                except pickle.UnpicklingError as e:
-                    EUtils.Error(f"(pickle error) Failed to load project data from {filePath}!")
-                    self.Projects = None
-                    return False
-                except Exception as e:
-                    EUtils.Error(f"Unhandled exception while attempting to load project data from {filePath}")
-                    EUtils.Error(e)
-                    self.Projects = None
-                    return False
+    #region Indexing
+    @staticmethod
+    def Normalize(value):
+        return None if value == None else str(value).strip().lower()
+
+    @staticmethod
+    def Trigrams(text):
+        return { text[i:i + 3] for i in range(len(text) - 2) }
+
+    def BuildIndexes(self):
+        self.ByID = {}
+        self.ByField = { field: {} for field in self.IndexedFields }
+        self.TitleKeys = list()   # Sorted (normalized title, ID) pairs for both Title and LongTitle
+        self.TitleTrigrams = {}   # Trigram -> set of IDs whose Title or LongTitle contains it
+        self.IndexedValues = {}   # ID -> the values the project was indexed under, used to un-index it
+        for project in self.Projects or ():
+            self.Index(project)
+
+    def Index(self, project):
+        values = {
+            "pi": self.Normalize(project.PI),
+            "institution": self.Normalize(project.Institution),
+            "department": self.Normalize(project.Department),
+            "titles": tuple({ t for t in (self.Normalize(project.Title), self.Normalize(project.LongTitle)) if t }),
+        }
+        self.ByID[project.ID] = project
+        for field in self.IndexedFields:
+            if values[field] != None:
+                self.ByField[field].setdefault(values[field], set()).add(project.ID)
+        for title in values["titles"]:
+            bisect.insort(self.TitleKeys, (title, project.ID))
+            for trigram in self.Trigrams(title):
+                self.TitleTrigrams.setdefault(trigram, set()).add(project.ID)
+        self.IndexedValues[project.ID] = values
+        project._owner = self
+
+    def Unindex(self, project):
+        values = self.IndexedValues.pop(project.ID, None)
+        if values == None:
+            return
+        for field in self.IndexedFields:
+            if values[field] != None:
+                self.ByField[field][values[field]].discard(project.ID)
+        for title in values["titles"]:
+            position = bisect.bisect_left(self.TitleKeys, (title, project.ID))
+            if position < len(self.TitleKeys) and self.TitleKeys[position] == (title, project.ID):
+                del self.TitleKeys[position]
+        stillIndexed = set()
+        for title in values["titles"]:
+            stillIndexed |= self.Trigrams(title)
+        for trigram in stillIndexed:
+            self.TitleTrigrams[trigram].discard(project.ID)
+        self.ByID.pop(project.ID, None)
+
+    def Reindex(self, project):
+        if project.ID in self.IndexedValues:
+            self.Unindex(project)
+            self.Index(project)
+
+    def Lookup(self, ids):
+        return [self.ByID[i] for i in sorted(ids)]
+    #endregion
+
+    #region Queries
+    def GetByID(self, projectID: int):
+        return self.ByID.get(projectID)
+
+    def FindByPI(self, pi: str):
+        return self.Lookup(self.ByField["pi"].get(self.Normalize(pi), ()))
+
+    def FindByInstitution(self, institution: str):
+        return self.Lookup(self.ByField["institution"].get(self.Normalize(institution), ()))
+
+    def FindByDepartment(self, department: str):
+        return self.Lookup(self.ByField["department"].get(self.Normalize(department), ()))
+
+    def FindByTitlePrefix(self, prefix: str):
+        """Return projects whose Title or LongTitle starts with prefix (case-insensitive)."""
+        prefix = self.Normalize(prefix)
+        ids = set()
+        position = bisect.bisect_left(self.TitleKeys, (prefix,))
+        while position < len(self.TitleKeys) and self.TitleKeys[position][0].startswith(prefix):
+            ids.add(self.TitleKeys[position][1])
+            position += 1
+        return self.Lookup(ids)
+
+    def SearchTitles(self, text: str):
+        """Return projects whose Title or LongTitle contains text (case-insensitive)."""
+        text = self.Normalize(text)
+        if len(text) < 3:
+            candidates = self.IndexedValues.keys()
         else:
-            EUtils.Warning(f"No file found at {filePath} to load project data from. Instantiating an empty list.")
-            self.Projects = list()
+            trigramSets = sorted((self.TitleTrigrams.get(t, set()) for t in self.Trigrams(text)), key=len)
+            candidates = trigramSets[0].intersection(*trigramSets[1:])
+        return self.Lookup(i for i in candidates if any(text in title for title in self.IndexedValues[i]["titles"]))
+    #endregion
+
+    def LoadProjects(self):
+        try:
+            if self.Store == None:
+                self.Store = GetStore()
+            self.Store.ImportPickle()
+            self.Projects = self.Store.LoadAll()
+            self.BuildIndexes()
             return True
+        except (sqlite3.Error, pickle.UnpicklingError) as e:
+            EUtils.Error(f"Failed to load project data from {ProjectStorePath}!")
+            EUtils.Error(e)
+            self.Projects = None
+            self.BuildIndexes()
+            return False
+
+    def Add(self, project):
+        """Store a new project. Only this project is written."""
+        try:
+            self.Store.Insert(project)
+            self.Projects.append(project)
+            self.Index(project)
+            return True
+        except sqlite3.Error as e:
+            EUtils.Error(f"Failed to add project {project.Title} to {self.Store.path}!")
+            EUtils.Error(e)
+        return False
+
+    def Update(self, project):
+        """Write changes made to an existing project. Only this project is written."""
+        try:
+            return self.Store.Update(project)
+        except sqlite3.Error as e:
+            EUtils.Error(f"Failed to update project {project.ID} in {self.Store.path}!")
+            EUtils.Error(e)
+        return False
 
     def Save(self):
-        filePath = "/opt/EmpireAI-Tools/share/projects.bin"
+        """Write the projects added or edited since they were loaded in a single transaction. Edits to a project
+        that someone else changed after this list was loaded are not written; reload the list and reapply them."""
         try:
-            os.makedirs(os.path.dirname(filePath), exist_ok=True)
-            with open(filePath, 'wb') as file:
-                pickle.dump(self.Projects, file)
-                EUtils.Success("Project data has been saved.")
-                return True
-        except pickle.PicklingError as e:
-            EUtils.Error(f"(pickle error) Failed to save project data to {filePath}!")
+            conflicts = self.Store.SaveChanges(self.Projects)
+            for project in self.Projects:
+                if project.ID not in self.IndexedValues:
+                    self.Index(project) # Appended to Projects directly and only given an ID by this save
+            if len(conflicts) > 0:
+                EUtils.Error(f"Projects {', '.join(str(p.ID) for p in conflicts)} were changed by someone else since they were loaded and were not saved.")
+                return False
+            EUtils.Success("Project data has been saved.")
+            return True
+        except sqlite3.Error as e:
+            EUtils.Error(f"Failed to save project data to {self.Store.path}!")
             EUtils.Error(e)
-        except Exception as e:
-            EUtils.Error(f"Unhandled exception while attempting to save project data to {filePath}!")
         return False
 
 class EmpireProject:
@@ -77,11 +351,50 @@ class EmpireProject:
         project.PI = pi_name
         project.Location = location
         project.Department = department
-        project.ID = EmpireProject.GetNextID()
+        return project # The ID is allocated by the store the project is added to
+
+    @staticmethod
+    def GetNextID():
+        return GetStore().AllocateID()
+
+    @staticmethod
+    def FromRow(row):
+        project = EmpireProject()
+        project._id, project._institution, project._long_title, project._title, project._pi, project._location, project._department = row
+        project.MarkSaved()
         return project
 #endregion
 
+#region Constructor
+    def __init__(self):
+        self._id = None
+        self._institution = None
+        self._long_title = None
+        self._title = None
+        self._pi = None
+        self._location = None
+        self._department = None
+        self._owner = None # The EmpireProjectList indexing this project, if any
+        self._loaded = None # The stored row as of the last load or save
+        self._dirty = False # Set by the property setters until the project is saved
+#endregion
+
 #region Class Methods
+    def Changed(self):
+        """Mark this project as edited and tell the owning EmpireProjectList to re-index it."""
+        self._dirty = True
+        owner = getattr(self, "_owner", None)
+        if owner != None:
+            owner.Reindex(self)
+
+    def MarkSaved(self):
+        self._loaded = self.ToRow()
+        self._dirty = False
+
+    def ToRow(self):
+        """Return the stored fields in EmpireProjectStore.Columns order."""
+        return (getattr(self, "_institution", None), getattr(self, "_long_title", None), getattr(self, "_title", None),
+                getattr(self, "_pi", None), getattr(self, "_location", None), getattr(self, "_department", None))
 #endregion
 
 #region Properties
@@ -93,6 +406,7 @@ class EmpireProject:
             print("EmpireProject: Attempt to set the institution of a project to an invalid value.")
         else:
             self._institution = value
+            self.Changed()
     
     Institution = property(GetInstitution, SetInstitution)
 
@@ -101,6 +415,7 @@ class EmpireProject:
     
     def SetLongTitle(self, value):
         self._long_title = value
+        self.Changed()
 
     LongTitle = property(GetLongTitle, SetLongTitle)
 
@@ -109,6 +424,7 @@ class EmpireProject:
     
     def SetShortTitle(self, value):
         self._title = value
+        self.Changed()
 
     Title = property(GetShortTitle, SetShortTitle)
 
@@ -117,6 +433,7 @@ class EmpireProject:
     
     def SetPI(self, value):
         self._pi = value
+        self.Changed()
     
     PI = property(GetPI, SetPI)
 
@@ -125,6 +442,7 @@ class EmpireProject:
     
     def SetLocation(self, value):
         self._location = value
+        self.Changed()
 
     Location = property(GetLocation, SetLocation)
 
@@ -133,6 +451,7 @@ class EmpireProject:
     
     def SetDepartment(self, value):
         self._department = value
+        self.Changed()
 
     Department = property(GetDepartment, SetDepartment)
 
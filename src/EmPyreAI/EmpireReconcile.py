@@ -0,0 +1,131 @@
+# This file contains the EmpireReconcile class which keeps CMSH group membership in line with Slurm accounts.
+#
+# Both sides are loaded in bulk: every slurmdb user and their account associations with one
+#   EmpireSlurm.GetAllUsers() call, and every CMSH group with one EmPyreAI.EmpireAPI.GetAll('Group') call.
+#   The desired membership of each group is the set of users associated with the account(s) mapped to it, and
+#   the minimal add/remove set is applied with a single commit per group.
+#
+# Class Functions:
+#   - Plan(): Returns a list of per-group change dicts without modifying anything.
+#   - Apply(): Computes the plan and applies it. Only reports it unless called with dryRun=False. Returns the plan with results.
+#   - Report(): Prints a plan or the results of Apply().
+#
+# Removing members is opt-in (prune=True) and a real Apply() always re-syncs the Slurm user cache first, so no one
+#   is removed because of a stale association list.
+#
+# Plan Dicts:
+#   { "group": str, "accounts": [str], "add": [str], "remove": [str], "status": str }
+#   status is one of "pending", "in_sync", "missing_group", "not_permitted", "dry_run", "committed", "failed"
+#
+# Author: Kali McLennan (Flatiron Institute) - kmclennan@flatironinstitute.org
+
+import getpass
+import time
+import EmPyreAI.EmpireAPI
+from EmPyreAI.EmpireGroup import EmpireGroup
+import EmPyreAI.EmpireUtils as EUtils
+
+class EmpireReconcile:
+  def __init__(self, slurm=None, accountGroups=None, prune=False, protected=()):
+    """
+    Input:
+      - slurm: an EmpireSlurm instance (one is created if not supplied)
+      - accountGroups: dict of Slurm account -> CMSH group name. If None, every account is mapped to the group of
+          the same name and accounts without a matching group are ignored.
+      - prune: if True, members without an association to a mapped account are removed. Off by default, since
+          groups can hold staff and service accounts that have no Slurm association.
+      - protected: usernames that are never removed from any group
+    """
+    if slurm == None:
+      from EmPyreAI.EmpireSlurm import EmpireSlurm
+      slurm = EmpireSlurm()
+    self.slurm = slurm
+    self.accountGroups = accountGroups
+    self.prune = prune
+    self.protected = set(protected)
+    self.groups = None
+
+  def LoadGroups(self):
+    self.groups = { group.name: group for group in EmPyreAI.EmpireAPI.GetAll('Group') }
+    return self.groups
+
+  def Plan(self, maxAge=None):
+    """maxAge bounds how stale (in seconds) the Slurm user cache may be. None uses the EmpireSlurm default.
+    Removals are only planned when maxAge is given and the cache was synced no earlier than maxAge seconds
+    before this call."""
+    requestedAt = time.time()
+    accountUsers = {}
+    for username, userData in self.slurm.GetAllUsers(maxAge).items():
+      for account in userData["accounts"]:
+        accountUsers.setdefault(account, set()).add(username)
+    prune = self.prune
+    lastSync = self.slurm.UserCache.lastSync if self.slurm.UserCache != None else None
+    if prune and (maxAge == None or lastSync == None or lastSync < requestedAt - maxAge):
+      # The sync failed and GetAllUsers fell back to older data; adding is still safe, removing is not
+      EUtils.Error("Slurm associations could not be confirmed as synced within maxAge seconds. No members will be removed.")
+      prune = False
+    groups = self.LoadGroups()
+
+    if self.accountGroups == None:
+      mapping = { account: account for account in accountUsers if account in groups }
+    else:
+      mapping = self.accountGroups
+
+    desired = {} # group name -> (set of accounts, set of usernames)
+    for account, groupname in mapping.items():
+      accounts, usernames = desired.setdefault(groupname, (set(), set()))
+      accounts.add(account)
+      usernames.update(accountUsers.get(account, ()))
+
+    plan = list()
+    for groupname in sorted(desired):
+      accounts, usernames = desired[groupname]
+      entry = { "group": groupname, "accounts": sorted(accounts), "add": [], "remove": [], "status": "pending" }
+      if groupname not in groups:
+        entry["status"] = "missing_group"
+      else:
+        current = set(groups[groupname].members)
+        entry["add"] = sorted(usernames - current)
+        if prune:
+          entry["remove"] = sorted(current - usernames - self.protected)
+        if len(entry["add"]) == 0 and len(entry["remove"]) == 0:
+          entry["status"] = "in_sync"
+      plan.append(entry)
+    return plan
+
+  def Apply(self, dryRun=True, maxAge=0):
+    """Changes are only made with dryRun=False. maxAge is passed to Plan() and defaults to 0 so changes are
+    always computed from freshly synced Slurm associations."""
+    plan = self.Plan(maxAge)
+    for entry in plan:
+      if entry["status"] != "pending":
+        continue
+      if dryRun:
+        entry["status"] = "dry_run"
+        continue
+      group = EmpireGroup(entry["group"], groupData=self.groups[entry["group"]])
+      if group.CanChange(getpass.getuser()) == False:
+        entry["status"] = "not_permitted"
+        continue
+      result = group.ChangeMembers(add=entry["add"], remove=entry["remove"], force=True)
+      entry["add"] = result["added"]
+      entry["remove"] = result["removed"]
+      entry["status"] = "committed" if result["committed"] else "failed"
+    return plan
+
+  @staticmethod
+  def Report(plan):
+    for entry in plan:
+      if entry["status"] == "in_sync":
+        continue
+      message = f"{entry['group']} ({', '.join(entry['accounts'])}): {entry['status']}"
+      if len(entry["add"]) > 0:
+        message += f" +[{', '.join(entry['add'])}]"
+      if len(entry["remove"]) > 0:
+        message += f" -[{', '.join(entry['remove'])}]"
+      if entry["status"] in ("committed", "dry_run", "pending"):
+        EUtils.Notice(message)
+      else:
+        EUtils.Warning(message)
+    inSync = sum(1 for entry in plan if entry["status"] == "in_sync")
+    EUtils.Notice(f"{inSync} of {len(plan)} groups already in sync.")
@@ -4,11 +4,21 @@
 #
 # Author: Kali McLennan (Flatiron Institute/Simons Foundation) - kmclennan@flatironinstitute.org
 
+import atexit
+import base64
 import getpass
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import os
+import json
+import time
+import threading
 from pathlib import Path
+from types import MappingProxyType
 import EmPyreAI.EmpireUtils as EUtils
+from EmPyreAI.EmpireNodeInventory import NodeInventory
+import EmPyreAI.EmpireMetrics as EMetrics
 
 class SlurmNode:
     def __init__(self, data):
@@ -46,118 +56,510 @@ class SlurmJob:
     
     State = property(GetJobState)
 
+class SlurmJobRecord:
+    """Compact, read-only view of a job holding only the fields requested from EmpireSlurm.IterJobs().
+    Fields that were not requested are None."""
+    Fields = ("job_id", "job_state", "user", "account", "partition", "nodes", "tres", "submit_time", "start_time", "end_time")
+    __slots__ = Fields
+
+    def __init__(self, data, fields = Fields):
+        for field in SlurmJobRecord.Fields:
+            setattr(self, field, SlurmJobRecord.Extract(data, field) if field in fields else None)
+
+    @staticmethod
+    def Extract(data, field):
+        if field == "job_state":
+            state = data.get("job_state")
+            if isinstance(state, str):
+                return (state,)
+            return tuple(state) if state != None else ()
+        if field == "user":
+            return data.get("user_name")
+        if field == "tres":
+            return data.get("tres_alloc_str") or data.get("tres_req_str")
+        if field.endswith("_time"):
+            value = data.get(field)
+            if isinstance(value, dict): # v0.0.39 wraps numbers as {"set": bool, "infinite": bool, "number": int}
+                return value.get("number") if value.get("set", True) else None
+            return value
+        return data.get(field)
+
+    def AsTuple(self):
+        return tuple(getattr(self, field) for field in SlurmJobRecord.Fields)
+
+    def __repr__(self):
+        return f"SlurmJobRecord({self.job_id}, {'+'.join(self.job_state or ())})"
+
+class SlurmUserCache:
+    """Local cache of slurmdb users and the accounts they are associated with.
+
+    The first Sync() downloads every user. Later syncs only ask slurmdb for users updated since the previous
+    sync (update_time) and apply those changes. A full reload still happens every fullSyncInterval seconds as
+    a safety net. The cache is saved to disk so a new process can start from it. The user data is only rewritten
+    when it changed; the time of the last sync is kept in a small sidecar file next to it.
+    """
+    def __init__(self, slurm, path: str = None, fullSyncInterval: int = 86400):
+        self.slurm = slurm
+        if path == None:
+            path = f"{Path.home()}/.cache/EmPyreAI/slurm_users_{slurm.config['apiServer']}.json"
+        self.path = path
+        self.fullSyncInterval = fullSyncInterval
+        self.lock = threading.Lock()
+        self.users = None
+        self.lastSync = None
+        self.lastFullSync = None
+        self.Load()
+
+    def Load(self):
+        if os.path.exists(self.path) == False:
+            return False
+        try:
+            with open(self.path) as cacheFile:
+                data = json.load(cacheFile)
+            self.users = data["users"]
+            self.lastSync = data["last_sync"]
+            self.lastFullSync = data["last_full_sync"]
+        except Exception as e:
+            EUtils.Warning(f"Ignoring unreadable Slurm user cache at {self.path}: {e}")
+            self.users = None
+            return False
+        try:
+            with open(self.GetSyncPath()) as syncFile:
+                self.lastSync = max(self.lastSync, json.load(syncFile)["last_sync"])
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            EUtils.Warning(f"Ignoring unreadable Slurm user cache sync time at {self.GetSyncPath()}: {e}")
+        return True
+
+    def GetSyncPath(self):
+        return f"{self.path}.sync"
+
+    def WriteFile(self, path: str, data: dict):
+        """Atomically replace path with data as JSON. Only the owner can read it."""
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmpPath = f"{path}.{os.getpid()}.tmp"
+            fd = os.open(tmpPath, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, "w") as cacheFile:
+                json.dump(data, cacheFile)
+            os.replace(tmpPath, path)
+            return True
+        except Exception as e:
+            EUtils.Warning(f"Ignoring unreadable Slurm user cache at {self.path}: {e}")
+            self.users = None
+            return False
+
+        except Exception as e:
+            EUtils.Warning(f"Unable to save the Slurm user cache to {path}: {e}")
+            return False
+
+    def Save(self):
+        """Write the user data and sync times."""
+        return self.WriteFile(self.path, { "users": self.users, "last_sync": self.lastSync, "last_full_sync": self.lastFullSync })
+
+    def SaveSyncTime(self):
+        """Record a sync that changed nothing without rewriting the user data."""
+        return self.WriteFile(self.GetSyncPath(), { "last_sync": self.lastSync })
+
+    def GetAge(self):
+        if self.lastSync == None:
+            return None
+        return time.time() - self.lastSync
+
+    def Sync(self, full: bool = False):
+        """Bring the cache up to date. Returns True on success."""
+        with self.lock:
+            now = time.time()
+            if self.users == None or self.lastFullSync == None or now - self.lastFullSync > self.fullSyncInterval:
+                full = True
+
+            if full:
+                changed = self.Fetch("")
+            else:
+                # Overlap the window slightly so clock skew between us and slurmdbd cannot drop an update
+                changed = self.Fetch(f"?update_time={int(self.lastSync) - 60}&with_deleted=true")
+            if changed == None:
+                return False
+
+            self.lastSync = now
+            if full == False and len(changed) == 0:
+                self.SaveSyncTime()
+                return True
+
+            # Build a new dict rather than editing the current one, which callers of GetAllUsers() may still hold
+            users = {} if full else dict(self.users)
+            for user in changed:
+                if "DELETED" in user.get("flags", []):
+                    users.pop(user["name"], None)
+                    continue
+                accountList = list()
+                for account in user.get("associations", []):
+                    if "DELETED" in (account.get("flags") or []):
+                        continue # with_deleted also returns removed associations of users that still exist
+                    accountList.append(account["account"])
+                users[user["name"]] = { "accounts": accountList }
+            self.users = users
+            if full:
+                self.lastFullSync = now
+            self.Save()
+            return True
+
+    def Fetch(self, additionalFields: str):
+        self.slurm.endpoint = self.slurm.endpoints["users"]
+        results = self.slurm.Get(additionalFields)
+        if results == None or results.status_code != 200:
+            EUtils.Error(f"Unable to load users from slurmdb (status {results.status_code if results != None else None}).")
+            return None
+        return results.json()["users"]
+
+    def GetAllUsers(self, maxAge: int = None):
+        """Return a read-only username -> {"accounts": [...]} mapping, syncing first if the cache is older than maxAge seconds.
+        The mapping is a snapshot: later syncs replace the cache instead of changing it."""
+        age = self.GetAge()
+        if age == None or (maxAge != None and age > maxAge):
+            self.Sync()
+        if self.users == None:
+            return MappingProxyType({})
+        return MappingProxyType(self.users)
+
+    def GetUserAccounts(self, username: str, maxAge: int = None):
+        return self.GetAllUsers(maxAge).get(username)
+
+class SlurmClientState:
+    """Process-wide Slurm API token and HTTP session shared by every EmpireSlurm and EmpireSlurmAsync instance.
+
+    The token is read from ~/.slurmtoken once and re-read whenever the file's modification time changes, so a
+    rotated token is picked up without restarting. Its expiry is decoded from the JWT locally; slurmrestd is only
+    asked (via diag) whether the token is still accepted when it is within tokenRefreshMargin seconds of expiring
+    or its expiry cannot be decoded. A 401 from any request re-reads the file and marks the token as rejected if
+    it has not been rotated.
+    """
+    def __init__(self, config):
+        self.config = config
+        self.lock = threading.RLock()
+        self.tokenPath = None
+        self.tokenMTime = None
+        self.jwt = None
+        self.expires = None
+        self.rejected = False
+        self.lastCheck = None
+        self.session = None
+        self.sessionKey = None
+
+    #region Token
+    @staticmethod
+    def DecodeExpiry(token: str):
+        """Return the exp claim of a JWT as a Unix timestamp, or None if it cannot be decoded. The signature is not checked."""
+        try:
+            payload = token.split(".")[1]
+            payload += "=" * (-len(payload) % 4)
+            return int(json.loads(base64.urlsafe_b64decode(payload))["exp"])
+        except (IndexError, ValueError, KeyError, TypeError):
+            return None
+
+    def GetTokenPath(self):
+        return f"{Path.home()}/.slurmtoken"
+
+    def Reload(self):
+        """Re-read the token file if it was created, replaced or modified since it was last read."""
+        path = self.GetTokenPath()
+        try:
+            mtime = os.stat(path).st_mtime_ns
+        except OSError:
+            mtime = None
+        with self.lock:
+            if path == self.tokenPath and mtime == self.tokenMTime:
+                return self.jwt
+            token = None
+            if mtime != None:
+                with open(path) as tokenfile:
+                    token = tokenfile.readline().strip()
+            self.tokenPath = path
+            self.tokenMTime = mtime
+            self.SetToken(token)
+            return self.jwt
+
+    def GetToken(self):
+        return self.Reload()
+
+    def SetToken(self, value):
+        with self.lock:
+            if value != self.jwt:
+                self.jwt = value
+                self.expires = None if value == None else self.DecodeExpiry(value)
+                self.rejected = False
+                self.lastCheck = None
+
+    def IsValid(self):
+        """Return False if there is no token or slurmrestd has rejected it. Only contacts slurmrestd when needed."""
+        with self.lock:
+            if self.Reload() == None or self.rejected:
+                return False
+            now = time.time()
+            if self.expires != None and now < self.expires - self.config["tokenRefreshMargin"]:
+                return True
+            if self.lastCheck != None and (self.expires == None or now - self.lastCheck < self.config["tokenCheckInterval"]):
+                return True # A token without a readable expiry is trusted after one successful check until a request returns 401
+            return self.Verify()
+
+    def Verify(self):
+        """Ask slurmrestd whether the current token is accepted by calling the diag endpoint."""
+        config = self.config
+        url = f"{config['protocol']}://{config['apiServer']}:{config['port']}/slurm/{config['apiVersion']}/diag"
+        with EMetrics.Time("slurm", "GET", "diag") as call:
+            try:
+                response = self.GetSession().get(url, timeout=(config["connectTimeout"], config["readTimeout"]))
+                call.status = response.status_code
+            except requests.exceptions.RequestException as e:
+                call.status = "error"
+                EUtils.Error(message=f"Slurm API request to {url} failed: {e}")
+                return True # Unreachable is not the same as rejected; let the real request report the failure
+        if response.status_code == 401:
+            self.rejected = True
+            return False
+        self.lastCheck = time.time()
+        return True
+
+    def Unauthorized(self, token: str):
+        """Handle a 401 for a request made with token. Returns True if a different token is now available to retry with."""
+        with self.lock:
+            if self.Reload() != token:
+                return self.jwt != None
+            self.rejected = True
+            return False
+    #endregion
+
+    #region Session
+    def GetSession(self):
+        """Return the shared requests.Session, rebuilding it if the connection settings have changed."""
+        with self.lock:
+            key = (self.config["poolSize"], self.config["retries"], self.config["backoff"])
+            if self.session == None or key != self.sessionKey:
+                if self.session != None:
+                    self.session.close()
+                self.session = EmpireSlurm.BuildSession(self.config)
+                self.sessionKey = key
+            token = self.jwt
+            if token != None and self.session.headers.get("X-SLURM-USER-TOKEN") != token:
+                self.session.headers.update({ "X-SLURM-USER-NAME": getpass.getuser(), "X-SLURM-USER-TOKEN": token })
+            return self.session
+
+    def Close(self):
+        with self.lock:
+            if self.session != None:
+                self.session.close()
+                self.session = None
+    #endregion
+
 class EmpireSlurm:
     config = {
         "apiVersion": "v0.0.39",
         "apiServer": "alpha-mgr",
         "protocol": "http",
         "port": 6820,
-        "verbose": True
+        "verbose": True,
+        "poolSize": 10,         # Maximum number of keep-alive connections held open to slurmrestd
+        "connectTimeout": 5,    # Seconds to wait for a TCP connection to slurmrestd
+        "readTimeout": 60,      # Seconds to wait for slurmrestd to send a response
+        "retries": 3,           # Retries on connection errors, resets and 5xx responses
+        "backoff": 0.5,         # Backoff factor between retries (0.5s, 1s, 2s, ...)
+        "userCacheMaxAge": 300, # Seconds the slurmdb user/association cache is trusted before an incremental sync
+        "tokenRefreshMargin": 120, # Seconds before the token's exp claim when slurmrestd is asked whether it is still valid
+        "tokenCheckInterval": 30,  # Seconds a successful check of a near-expiry token is trusted
+        "clusterName": None        # slurmdb cluster new associations are created on (None lets slurmdbd choose)
     }
 
     def __init__(self):
-        self.endpoints = {
-            "diag": "slurm/" + self.config["apiVersion"] + "/diag",
-            "accounts": "slurmdb/" + self.config["apiVersion"] + "/accounts",
-            "account": "slurmdb/" + self.config["apiVersion"] + "/account/",
-            "partitions": "slurm/" + self.config["apiVersion"] + "/partitions",
-            "partition": "slurm/" + self.config["apiVersion"] + "/partition/",
-            "users": "slurmdb/" + self.config["apiVersion"] + "/users",
-            "nodes": "slurm/" + self.config["apiVersion"] + "/nodes",
-            "node": "slurm/" + self.config["apiVersion"] + "/node/",
-            "jobs": "slurm/" + self.config["apiVersion"] + "/jobs",
-            "job": "slurm/" + self.config["apiVersion"] + "/job/",
-        }
+        self.endpoints = EmpireSlurm.BuildEndpoints(self.config["apiVersion"])
         self.username = getpass.getuser()
-        self.ValidToken = True
-        self.token = self.LoadToken()
+        self.baseURL = f"{self.config['protocol']}://{self.config['apiServer']}:{self.config['port']}"
+        self.endpoint = self.endpoints["diag"]
         if self.token == None:
             # Cannot load the token from the users home directory
             EUtils.Error(message="Unable to load Slurm API token from ~/.slurmtoken", fatal=False)
-            self.ValidToken = False
-
-        # Run a GET request for the diag endpoint to verify that the token is active and valid.
-        self.endpoint = self.endpoints["diag"]
-        getTest = self.Get()
-        if getTest.status_code == 401:
-            # 401 error indicates the token has expired
+        elif self.ValidToken == False:
+            # The token has expired. SharedState only asks slurmrestd when the token is close to its expiry time.
             EUtils.Error(message="The token loaded from ~/.slurmtoken is no longer valid.", fatal=True)
-            self.ValidToken = False
         self.AllUsers = None
+        self.UserCache = None
+        self.JobsStatus = None
+
+    @staticmethod
+    def BuildEndpoints(apiVersion: str):
+        """Return the table of slurmrestd endpoint paths for the given API version."""
+        return {
+            "diag": "slurm/" + apiVersion + "/diag",
+            "accounts": "slurmdb/" + apiVersion + "/accounts",
+            "account": "slurmdb/" + apiVersion + "/account/",
+            "partitions": "slurm/" + apiVersion + "/partitions",
+            "partition": "slurm/" + apiVersion + "/partition/",
+            "users": "slurmdb/" + apiVersion + "/users",
+            "nodes": "slurm/" + apiVersion + "/nodes",
+            "node": "slurm/" + apiVersion + "/node/",
+            "jobs": "slurm/" + apiVersion + "/jobs",
+            "job": "slurm/" + apiVersion + "/job/",
+            "dbjobs": "slurmdb/" + apiVersion + "/jobs",
+            "associations": "slurmdb/" + apiVersion + "/associations",
+        }
+
+    @staticmethod
+    def GetEndpointLabel(endpoints, path):
+        """Map a request path back to its endpoint name (ex. slurm/v0.0.39/node/a001 -> node) for metrics labels."""
+        for name, prefix in endpoints.items():
+            if path == prefix or (prefix.endswith("/") and path.startswith(prefix)):
+                return name
+        return path
 
     def GetNode(self, nodeName):
         self.endpoint = self.endpoints["node"] + nodeName
         results = self.Get()
-        if results.status_code == 200:
+        if results != None and results.status_code == 200:
             node = SlurmNode(results.json())
             return node
         else:
-            print("[ DEBUG ] GetNode(): Return code = {results.status_code}")
+            print(f"[ DEBUG ] GetNode(): Return code = {results.status_code if results != None else None}")
             return None
 
-    def LoadToken(self):
-        if os.path.exists(f"{Path.home()}/.slurmtoken"):
-            with open(f"{Path.home()}/.slurmtoken") as tokenfile:
-                return tokenfile.readline().strip()
+    def GetNodeInventory(self):
+        """Load every node with a single request to the nodes endpoint and return an indexed NodeInventory."""
+        self.endpoint = self.endpoints["nodes"]
+        results = self.Get()
+        if results != None and results.status_code == 200:
+            return NodeInventory(results.json())
         else:
+            print(f"[ DEBUG ] GetNodeInventory(): Return code = {results.status_code if results != None else None}")
             return None
 
+    @staticmethod
+    def LoadToken():
+        """Return the current token from ~/.slurmtoken, re-reading the file only if it has changed."""
+        return SharedState.GetToken()
+
     #region Basic GET PUT POST Functions
 
-    def GetUserAccounts(self, username):
-        self.GetAllUsers()
+    def GetUserAccounts(self, username, maxAge: int = None):
+        """Return {"accounts": [...]} for the user from the slurmdb user cache, or None if the user is unknown.
+        maxAge bounds how stale (in seconds) the cached data may be; it defaults to config["userCacheMaxAge"]."""
+        self.GetAllUsers(maxAge)
         if username in self.AllUsers:
             return self.AllUsers[username]
         else:
             return None
 
-    def GetAllUsers(self):
-        if self.AllUsers == None:
-            self.endpoint = self.endpoints["users"]
-            results = self.Get()
-            retVal = {}
-            if results.status_code == 200:
-                if self.config["verbose"]:
-                    print("[ DEBUG ] GetAllUsers(): Return code = {results.status_code}")
-                resultJson = results.json()
-                for user in resultJson["users"]:
-                    thisUser = {}
-                    accountList = list()
-                    for account in user["associations"]:
-                        accountList.append(account["account"])
-                    thisUser["accounts"] = accountList
-
-                    retVal[user["name"]] = thisUser
-            self.AllUsers = retVal
-        return self.AllUsers               
-
-    def Post(self):
-        pass
-
-    def Get(self, additionalFields = ""):
+    def GetAllUsers(self, maxAge: int = None):
+        if self.UserCache == None:
+            self.UserCache = SlurmUserCache(self)
+        if maxAge == None:
+            maxAge = self.config["userCacheMaxAge"]
+        self.AllUsers = self.UserCache.GetAllUsers(maxAge)
+        return self.AllUsers
+
+    def IterJobs(self, fields = SlurmJobRecord.Fields, additionalFields: str = "", where = None):
+        """Yield a SlurmJobRecord for every job returned by the jobs endpoint.
+
+        The response is parsed incrementally as it arrives (requires the ijson package) and each job is reduced
+        to the requested fields before the next one is read, so memory use does not grow with the payload size.
+        where, if given, is called with each raw job dict and jobs it returns False for are skipped unparsed.
+        JobsStatus holds the HTTP status of the request (None if it failed to connect).
+        """
+        import ijson
+
+        for field in fields:
+            if field not in SlurmJobRecord.Fields:
+                raise ValueError(f"Unknown job field {field}. Valid fields are: {', '.join(SlurmJobRecord.Fields)}")
+        fields = frozenset(fields)
+
+        self.endpoint = self.endpoints["jobs"]
+        results = self.Get(additionalFields, stream=True)
+        self.JobsStatus = results.status_code if results != None else None
+        if results == None or results.status_code != 200:
+            EUtils.Error(f"Unable to load jobs from slurmrestd (status {results.status_code if results != None else None}).")
+            return
+        try:
+            results.raw.decode_content = True
+            for job in ijson.items(results.raw, "jobs.item", use_float=True):
+                if where == None or where(job):
+                    yield SlurmJobRecord(job, fields)
+        finally:
+            results.close()
+
+    def Post(self, body: dict, additionalFields = ""):
+        """POST body as JSON to the selected endpoint. Returns the response, or None if the request could not be made."""
+        return self.Request("POST", additionalFields, body=body)
+
+    def Get(self, additionalFields = "", stream: bool = False):
+        return self.Request("GET", additionalFields, stream=stream)
+
+    def Put(self, body: dict, additionalFields = ""):
+        """PUT body as JSON to the selected endpoint. Returns the response, or None if the request could not be made."""
+        return self.Request("PUT", additionalFields, body=body)
+
+    def Request(self, method: str, additionalFields = "", body: dict = None, stream: bool = False):
         if self.ValidToken == False:
             EUtils.Error(message="Refusing to query the Slurm API due to an expired authentication token.")
             return None
         
-        if self.token != None:
+        token = self.token
+        if token != None:
             if additionalFields != None:
-                url = f"{self.config['protocol']}://{self.config['apiServer']}:{self.config['port']}/{self.endpoint}/{additionalFields}"
+                url = f"{self.baseURL}/{self.endpoint}/{additionalFields}"
             else:
-                url = f"{self.config['protocol']}://{self.config['apiServer']}:{self.config['port']}/{self.endpoint}"
+                url = f"{self.baseURL}/{self.endpoint}"
             if self.config["verbose"]:
-                print(f"[ DEBUG ] Request URL: {url}")
-            response = requests.get(url, headers=self.GetHeaders())
-            return response
+                print(f"[ DEBUG ] Request URL: {method} {url}")
+            with EMetrics.Time("slurm", method, EmpireSlurm.GetEndpointLabel(self.endpoints, self.endpoint)) as call:
+                try:
+                    response = self.session.request(method, url, json=body, timeout=self.GetTimeout(), stream=stream)
+                    if response.status_code == 401 and SharedState.Unauthorized(token):
+                        # The token file was rotated since this request was sent; retry once with the new token
+                        response.close()
+                        response = self.session.request(method, url, json=body, timeout=self.GetTimeout(), stream=stream)
+                    call.status = response.status_code
+                    return response
+                except requests.exceptions.RequestException as e:
+                    call.status = "error"
+                    EUtils.Error(message=f"Slurm API request to {url} failed: {e}")
+                    return None
         else:
-            print(f"No Slurm API token found. Cannot use GET.")
+            print(f"No Slurm API token found. Cannot use {method}.")
             return None
+    #endregion
+
+    #region HTTP Session
+    @staticmethod
+    def BuildSession(config):
+        """Build a requests.Session with a keep-alive connection pool and bounded retries with backoff."""
+        retries = Retry(
+            total=config["retries"],
+            connect=config["retries"],
+            read=config["retries"],
+            status=config["retries"],
+            backoff_factor=config["backoff"],
+            status_forcelist=(500, 502, 503, 504),
+            raise_on_status=False # Hand the final 5xx response back to the caller instead of raising
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=config["poolSize"], max_retries=retries)
+        session = requests.Session()
+        session.mount("http://", adapter)
+        session.mount("https://", adapter)
+        return session
+
+    def GetTimeout(self):
+        return (self.config["connectTimeout"], self.config["readTimeout"])
+
+    def GetSession(self):
+        return SharedState.GetSession()
 
-    def Put(self):
-        pass
+    session = property(GetSession)
+
+    def Close(self):
+        """Close all pooled connections to slurmrestd. The next request from any instance opens new ones."""
+        SharedState.Close()
     #endregion
 
     #region Headers
-    # Headers need to include X-SLURM-USER-NAME and X-SLURM-USER-TOKEN
+    # Headers need to include X-SLURM-USER-NAME and X-SLURM-USER-TOKEN. They are attached to the shared session by SharedState.
     def GetHeaders(self):
         return {
             "X-SLURM-USER-NAME": self.username,
@@ -167,12 +569,17 @@ class EmpireSlurm:
 
     #region Token Property
     def GetToken(self):
-        return self.jwt
+        return SharedState.GetToken()
     
     def SetToken(self, value):
-        self.jwt = value    
+        SharedState.SetToken(value)
 
     token = property(GetToken, SetToken)
+
+    def GetValidToken(self):
+        return SharedState.IsValid()
+
+    ValidToken = property(GetValidToken)
     #endregion
 
     #region Endpoint Selection Property
@@ -186,3 +593,6 @@ class EmpireSlurm:
     #endregion
 
     
+
+SharedState = SlurmClientState(EmpireSlurm.config)
+atexit.register(SharedState.Close)
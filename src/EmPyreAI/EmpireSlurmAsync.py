@@ -0,0 +1,159 @@
+# This file contains the EmpireSlurmAsync class, an asyncio client for the Slurm REST API.
+#
+# EmpireSlurm is synchronous and selects its endpoint through shared instance state, so it can only issue one
+#   request at a time. EmpireSlurmAsync shares its configuration and endpoint table but passes the endpoint
+#   with each request, so many node/job/account lookups can be in flight at once. A semaphore caps how many
+#   requests run concurrently.
+#
+# Class Functions (all coroutines):
+#   - GetNode() / GetJob() / GetAccount(): Fetch a single object. Returns SlurmNode, SlurmJob or dict (None on failure).
+#   - GetNodes() / GetJobs() / GetAccounts(): Fetch many objects concurrently. Returns a dict keyed by the requested name/ID.
+#   - Close(): Closes the underlying HTTP session.
+#
+# Static Functions:
+#   - Run(): Runs one of the coroutines above to completion from synchronous code.
+#
+# Example:
+#   nodes = EmpireSlurmAsync.Run(lambda client: client.GetNodes(nodeNames))
+#
+# Requires the aiohttp package.
+#
+# API Documentation: https://slurm.schedmd.com/rest_api.html
+#
+# Author: Kali McLennan (Flatiron Institute/Simons Foundation) - kmclennan@flatironinstitute.org
+
+import asyncio
+import getpass
+from EmPyreAI.EmpireSlurm import EmpireSlurm, SlurmNode, SlurmJob, SharedState
+import EmPyreAI.EmpireUtils as EUtils
+import EmPyreAI.EmpireMetrics as EMetrics
+
+class EmpireSlurmAsync:
+    config = EmpireSlurm.config # Shared with EmpireSlurm so both clients always point at the same server
+
+    def __init__(self, maxConcurrency: int = 32):
+        self.endpoints = EmpireSlurm.BuildEndpoints(self.config["apiVersion"])
+        self.username = getpass.getuser()
+        self.baseURL = f"{self.config['protocol']}://{self.config['apiServer']}:{self.config['port']}"
+        self.maxConcurrency = maxConcurrency
+        if self.token == None:
+            EUtils.Error(message="Unable to load Slurm API token from ~/.slurmtoken", fatal=False)
+        self.session = None
+        self.semaphore = None
+
+    #region Session Handling
+    async def Open(self):
+        """Create the aiohttp session. Must be called from inside the running event loop."""
+        import aiohttp
+
+        if self.session == None:
+            timeout = aiohttp.ClientTimeout(sock_connect=self.config["connectTimeout"], sock_read=self.config["readTimeout"])
+            connector = aiohttp.TCPConnector(limit=self.maxConcurrency)
+            self.session = aiohttp.ClientSession(timeout=timeout, connector=connector)
+            self.semaphore = asyncio.Semaphore(self.maxConcurrency)
+        return self
+
+    async def Close(self):
+        if self.session != None:
+            await self.session.close()
+            self.session = None
+            self.semaphore = None
+
+    async def __aenter__(self):
+        return await self.Open()
+
+    async def __aexit__(self, excType, excValue, traceback):
+        await self.Close()
+
+    # Headers are sent per request because the token is shared with EmpireSlurm and may be rotated while the session is open
+    def GetHeaders(self):
+        return {
+            "X-SLURM-USER-NAME": self.username,
+            "X-SLURM-USER-TOKEN": self.token
+        }
+
+    def GetToken(self):
+        return SharedState.GetToken()
+
+    token = property(GetToken)
+    #endregion
+
+    #region Requests
+    async def Get(self, endpoint: str, additionalFields: str = ""):
+        """GET an endpoint path and return (status, decoded JSON). Retries connection errors and 5xx with backoff."""
+        import aiohttp
+
+        if self.token == None:
+            EUtils.Error(message="No Slurm API token found. Cannot use GET.")
+            return None, None
+        await self.Open()
+
+        url = f"{self.baseURL}/{endpoint}/{additionalFields}"
+        if self.config["verbose"]:
+            print(f"[ DEBUG ] Request URL: {url}")
+        attempt = 0
+        rotated = False
+        async with self.semaphore:
+            with EMetrics.Time("slurm", "GET", EmpireSlurm.GetEndpointLabel(self.endpoints, endpoint)) as call:
+                while True:
+                    try:
+                        token = self.token
+                        async with self.session.get(url, headers=self.GetHeaders()) as response:
+                            if response.status == 401 and rotated == False and SharedState.Unauthorized(token):
+                                rotated = True # The token file was rotated; retry once with the new token
+                                continue
+                            if response.status < 500 or attempt >= self.config["retries"]:
+                                call.status = response.status
+                                if response.status == 200:
+                                    return response.status, await response.json(content_type=None)
+                                return response.status, None
+                    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                        if attempt >= self.config["retries"]:
+                            call.status = "error"
+                            EUtils.Error(message=f"Slurm API request to {url} failed: {e}")
+                            return None, None
+                    await asyncio.sleep(self.config["backoff"] * (2 ** attempt))
+                    attempt += 1
+
+    async def GetNode(self, nodeName: str):
+        status, data = await self.Get(self.endpoints["node"] + nodeName)
+        if status == 200:
+            return SlurmNode(data)
+        return None
+
+    async def GetJob(self, jobID):
+        status, data = await self.Get(self.endpoints["job"] + str(jobID))
+        if status == 200:
+            return SlurmJob(data)
+        return None
+
+    async def GetAccount(self, accountName: str):
+        status, data = await self.Get(self.endpoints["account"] + accountName)
+        if status == 200:
+            return data
+        return None
+
+    async def GetMany(self, func, keys):
+        keys = list(keys)
+        results = await asyncio.gather(*(func(key) for key in keys))
+        return dict(zip(keys, results))
+
+    async def GetNodes(self, nodeNames):
+        return await self.GetMany(self.GetNode, nodeNames)
+
+    async def GetJobs(self, jobIDs):
+        return await self.GetMany(self.GetJob, jobIDs)
+
+    async def GetAccounts(self, accountNames):
+        return await self.GetMany(self.GetAccount, accountNames)
+    #endregion
+
+    #region Synchronous Entry Point
+    @staticmethod
+    def Run(func, maxConcurrency: int = 32):
+        """Run func(client) in a new event loop with a fresh client and return its result."""
+        async def Main():
+            async with EmpireSlurmAsync(maxConcurrency) as client:
+                return await func(client)
+        return asyncio.run(Main())
+    #endregion
@@ -0,0 +1,150 @@
+# This file contains the EmpireSlurmProvision class, which creates slurmdb accounts, users and associations in bulk.
+#
+# Accounts, users and associations are each submitted as lists in as few slurmdb POST requests as possible
+#   (batchSize items per request). slurmdb answers a batch as a whole, so when a batch is rejected it is split in
+#   half and each half is resubmitted until the items that fail are isolated. Every item gets its own result, and
+#   a batch with a single bad entry costs a few extra requests rather than one request per item.
+#
+# Associations can carry QOS and TRES limits. Limits are given as {"gres/gpu": 8, "cpu": 256} dicts:
+#   - maxTresPerJob: most TRES any one job in the association may allocate (MaxTRES).
+#   - grpTres: most TRES all running jobs in the association may allocate together (GrpTRES).
+#
+# Class Functions:
+#   - AddAccounts() / AddUsers() / AddAssociations(): Submit entries built with Account() / User() / Association().
+#     Each returns a list of result dicts: { "name": ..., "ok": bool, "error": str or None }.
+#   - ProvisionLab(): Creates a lab account, its users and their associations in three batched steps.
+#
+# Static Functions:
+#   - Account() / User() / Association(): Build the slurmdb entries the Add functions submit.
+#
+# Example:
+#   provision = EmpireSlurmProvision()
+#   results = provision.ProvisionLab("smithlab", ["asmith", "bjones"], organization="Flatiron",
+#                                    qos=["normal"], maxTresPerJob={"gres/gpu": 8})
+#
+# API Documentation: https://slurm.schedmd.com/rest_api.html
+#
+# Author: Kali McLennan (Flatiron Institute/Simons Foundation) - kmclennan@flatironinstitute.org
+
+from EmPyreAI.EmpireSlurm import EmpireSlurm
+import EmPyreAI.EmpireUtils as EUtils
+
+def TresList(limits: dict):
+    """Convert {"gres/gpu": 8, "cpu": 256} into the slurmdb TRES list format."""
+    retVal = list()
+    for tres, count in limits.items():
+        kind, _, name = tres.partition("/")
+        entry = { "type": kind, "count": int(count) }
+        if len(name) > 0:
+            entry["name"] = name
+        retVal.append(entry)
+    return retVal
+
+class EmpireSlurmProvision:
+    def __init__(self, slurm = None, batchSize: int = 500):
+        self.slurm = EmpireSlurm() if slurm == None else slurm
+        self.batchSize = batchSize
+
+    #region Entry Builders
+    @staticmethod
+    def Account(name: str, description: str = None, organization: str = None):
+        return { "name": name, "description": description or name, "organization": organization or name }
+
+    @staticmethod
+    def User(name: str, defaultAccount: str):
+        return { "name": name, "default": { "account": defaultAccount } }
+
+    @staticmethod
+    def Association(user: str, account: str, partition: str = None, qos = None, defaultQOS: str = None,
+                    maxTresPerJob: dict = None, grpTres: dict = None):
+        retVal = { "user": user, "account": account }
+        if EmpireSlurm.config["clusterName"] != None:
+            retVal["cluster"] = EmpireSlurm.config["clusterName"]
+        if partition != None:
+            retVal["partition"] = partition
+        if qos != None:
+            retVal["qos"] = list(qos)
+        if defaultQOS != None:
+            retVal["default"] = { "qos": defaultQOS }
+        tres = {}
+        if maxTresPerJob != None:
+            tres["per"] = { "job": TresList(maxTresPerJob) }
+        if grpTres != None:
+            tres["group"] = { "active": TresList(grpTres) }
+        if len(tres) > 0:
+            retVal["max"] = { "tres": tres }
+        return retVal
+
+    @staticmethod
+    def GetItemName(item: dict):
+        if "user" in item:
+            return f"{item['user']}@{item['account']}" + (f":{item['partition']}" if "partition" in item else "")
+        return item["name"]
+    #endregion
+
+    #region Submission
+    def PostBatch(self, endpointName: str, key: str, items):
+        """POST one batch. Returns None on success or an error message."""
+        self.slurm.endpoint = self.slurm.endpoints[endpointName]
+        response = self.slurm.Post({ key: items }, additionalFields=None)
+        if response == None:
+            return "request failed"
+        try:
+            errors = response.json().get("errors") or []
+        except ValueError:
+            errors = []
+        if response.status_code == 200 and len(errors) == 0:
+            return None
+        messages = [e.get("description") or e.get("error") or str(e) for e in errors]
+        return "; ".join(messages) if len(messages) > 0 else f"status {response.status_code}"
+
+    def Submit(self, endpointName: str, key: str, items):
+        """Submit items in batches, bisecting rejected batches down to the items that fail. Returns per-item results."""
+        items = list(items)
+        results = [None] * len(items)
+
+        def Send(start: int, end: int):
+            error = self.PostBatch(endpointName, key, items[start:end])
+            if error == None:
+                for i in range(start, end):
+                    results[i] = { "name": self.GetItemName(items[i]), "ok": True, "error": None }
+            elif end - start == 1:
+                results[start] = { "name": self.GetItemName(items[start]), "ok": False, "error": error }
+            else:
+                middle = (start + end) // 2
+                Send(start, middle)
+                Send(middle, end)
+
+        for start in range(0, len(items), self.batchSize):
+            Send(start, min(start + self.batchSize, len(items)))
+        failed = [r for r in results if r["ok"] == False]
+        if len(failed) > 0:
+            EUtils.Warning(f"{len(failed)} of {len(items)} {key} could not be added: {', '.join(r['name'] for r in failed)}")
+        return results
+
+    def AddAccounts(self, accounts):
+        return self.Submit("accounts", "accounts", accounts)
+
+    def AddUsers(self, users):
+        return self.Submit("users", "users", users)
+
+    def AddAssociations(self, associations):
+        return self.Submit("associations", "associations", associations)
+
+    def ProvisionLab(self, account: str, usernames, description: str = None, organization: str = None,
+                     partition: str = None, qos = None, defaultQOS: str = None, maxTresPerJob: dict = None, grpTres: dict = None):
+        """Create account, add every user with it as their default account and associate them with the given limits.
+        Returns { "accounts": [...], "users": [...], "associations": [...] } result lists. Users whose user entry
+        failed are not associated."""
+        usernames = list(usernames)
+        retVal = { "accounts": self.AddAccounts([self.Account(account, description, organization)]) }
+        if retVal["accounts"][0]["ok"] == False:
+            retVal["users"], retVal["associations"] = [], []
+            return retVal
+        retVal["users"] = self.AddUsers([self.User(username, account) for username in usernames])
+        added = [r["name"] for r in retVal["users"] if r["ok"]]
+        retVal["associations"] = self.AddAssociations([
+            self.Association(username, account, partition, qos, defaultQOS, maxTresPerJob, grpTres) for username in added
+        ])
+        return retVal
+    #endregion
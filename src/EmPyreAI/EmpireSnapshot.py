@@ -0,0 +1,149 @@
+# This file contains the EmpireSnapshot class, a local on-disk copy of CMSH users, groups and group membership.
+#
+# Read-heavy tools (shell completion, prompt helpers, login node utilities) only need approximate directory data.
+#   A snapshot is a small SQLite file holding the fields EmpireUser and EmpireGroup read. Once a snapshot is enabled
+#   with EmPyreAI.EmpireAPI.UseSnapshot() (or EmpireSnapshot.Enable()), every lookup made through EmpireAPI - and
+#   therefore EmpireUser.Exists(), EmpireUser(...), EmpireUser.GetAll(), EmpireGroup(...), etc. - is answered from
+#   the file without a CMSH connection. Entities loaded from a snapshot refuse to commit, and asking for a user
+#   that is not in the snapshot raises EmpireAPI.ReadOnlyError instead of starting a new CMSH user.
+#
+# Refresh() pulls users and groups from CMSH and writes only the rows that were added, changed or removed since
+#   the previous refresh.
+#
+# Class Functions:
+#   - Refresh(): Synchronizes the snapshot with CMSH. Returns a dict of added/changed/removed counts per entity type.
+#   - GetByName(): Returns a read-only entity for a user or group, or None.
+#   - GetAll(): Returns a list of read-only entities of a given type.
+#
+# Static Functions:
+#   - Enable(): Opens a snapshot and routes all EmpireAPI lookups to it.
+#
+# Author: Kali McLennan (Flatiron Institute) - kmclennan@flatironinstitute.org
+
+import os
+import json
+import hashlib
+import sqlite3
+import threading
+from pathlib import Path
+import EmPyreAI.EmpireAPI as E_API
+import EmPyreAI.EmpireUtils as EUtils
+
+class SnapshotCommitResult:
+    good = False
+
+class SnapshotEntity:
+    """Stand-in for a pythoncm User or Group entity loaded from a snapshot. It is read-only."""
+    def __init__(self, **fields):
+        self.__dict__.update(fields)
+
+    def commit(self):
+        EUtils.Error(f"{self.name} was loaded from a read-only directory snapshot and cannot be committed.")
+        return SnapshotCommitResult()
+
+class EmpireSnapshot:
+    UserFields = ("name", "ID", "email", "commonName", "surname", "notes", "homeDirectory", "loginShell")
+    GroupFields = ("name", "ID", "members")
+
+    def __init__(self, path: str = None):
+        if path == None:
+            path = f"{Path.home()}/.cache/EmPyreAI/directory.db"
+        self.path = path
+        self.lock = threading.RLock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if os.path.exists(path) == False:
+            os.close(os.open(path, os.O_WRONLY | os.O_CREAT, 0o600)) # Notes hold personal data, keep the file private
+        self.connection = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS users (
+            name TEXT PRIMARY KEY, ID INTEGER, email TEXT, commonName TEXT, surname TEXT, notes TEXT,
+            homeDirectory TEXT, loginShell TEXT, digest TEXT)""")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS groups (name TEXT PRIMARY KEY, ID INTEGER, members TEXT, digest TEXT)")
+        self.connection.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+
+    @staticmethod
+    def Enable(path: str = None):
+        """Open a snapshot and make it the source for every EmPyreAI.EmpireAPI lookup. Returns the snapshot."""
+        snapshot = EmpireSnapshot(path)
+        E_API.UseSnapshot(snapshot)
+        return snapshot
+
+    #region Refresh
+    @staticmethod
+    def UserRow(userData):
+        return tuple(getattr(userData, field, None) for field in EmpireSnapshot.UserFields)
+
+    @staticmethod
+    def GroupRow(groupData):
+        return (groupData.name, groupData.ID, json.dumps(sorted(groupData.members or ())))
+
+    @staticmethod
+    def Digest(row):
+        return hashlib.sha1(json.dumps(row, default=str).encode()).hexdigest()
+
+    def Sync(self, db, table, columns, rows):
+        existing = dict(db.execute(f"SELECT name, digest FROM {table}").fetchall())
+        counts = { "added": 0, "changed": 0, "removed": 0 }
+        seen = set()
+        for row in rows:
+            name = row[0]
+            seen.add(name)
+            digest = self.Digest(row)
+            if existing.get(name) == digest:
+                continue
+            counts["changed" if name in existing else "added"] += 1
+            db.execute(f"INSERT OR REPLACE INTO {table} ({', '.join(columns)}, digest) VALUES ({', '.join('?' * (len(columns) + 1))})",
+                       row + (digest,))
+        for name in existing.keys() - seen:
+            db.execute(f"DELETE FROM {table} WHERE name = ?", (name,))
+            counts["removed"] += 1
+        return counts
+
+    def Refresh(self):
+        """Pull users and groups from CMSH and apply only the differences to the snapshot."""
+        users = [self.UserRow(u) for u in E_API.GetAll('User', live=True)]
+        groups = [self.GroupRow(g) for g in E_API.GetAll('Group', live=True)]
+        with self.lock:
+            db = self.connection
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                retVal = {
+                    "users": self.Sync(db, "users", self.UserFields, users),
+                    "groups": self.Sync(db, "groups", self.GroupFields, groups)
+                }
+                db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('refreshed_at', strftime('%s', 'now'))")
+            except:
+                db.execute("ROLLBACK")
+                raise
+            db.execute("COMMIT")
+        return retVal
+
+    def GetRefreshedAt(self):
+        row = self.connection.execute("SELECT value FROM meta WHERE key = 'refreshed_at'").fetchone()
+        return None if row == None else int(row[0])
+    #endregion
+
+    #region Queries
+    def ToEntity(self, entityType, row):
+        if entityType == 'User':
+            return SnapshotEntity(**dict(zip(self.UserFields, row)))
+        fields = dict(zip(self.GroupFields, row))
+        fields["members"] = json.loads(fields["members"])
+        return SnapshotEntity(**fields)
+
+    def GetQuery(self, entityType):
+        if entityType == 'User':
+            return f"SELECT {', '.join(self.UserFields)} FROM users"
+        if entityType == 'Group':
+            return f"SELECT {', '.join(self.GroupFields)} FROM groups"
+        raise ValueError(f"Directory snapshots only hold User and Group entities, not {entityType}.")
+
+    def GetByName(self, name: str, entityType: str):
+        with self.lock:
+            row = self.connection.execute(self.GetQuery(entityType) + " WHERE name = ?", (name,)).fetchone()
+        return None if row == None else self.ToEntity(entityType, row)
+
+    def GetAll(self, entityType: str):
+        with self.lock:
+            rows = self.connection.execute(self.GetQuery(entityType) + " ORDER BY name").fetchall()
+        return [self.ToEntity(entityType, row) for row in rows]
+    #endregion
@@ -0,0 +1,235 @@
+# This file contains the EmpireUsage class, which produces GPU/CPU/memory-hour usage reports from slurmdb job records.
+#
+# Usage is computed one calendar day (local time) at a time. For each day the slurmdb jobs endpoint is asked for
+#   every job that ran during the day, each job's run time is clipped to the day, and its allocated TRES are turned
+#   into hours and summed per (user, account, partition). The sums are kept in column arrays while a day is being
+#   aggregated and then written to a local SQLite file. A report only fetches days that are not in the file yet, so
+#   a monthly report after the first one costs at most a few days of job records. The current day is never stored
+#   because it is not over; reports cover complete days only.
+#
+# A job that runs across midnight contributes to each day it ran on, and counts as a job on each of those days.
+#
+# Class Functions:
+#   - Update(): Fetches and stores every complete day in a date range that is not stored yet.
+#   - Aggregate(): Fetches and aggregates one day without storing it. Returns a DailyUsage.
+#   - GetUsage(): Returns usage summed over a date range, grouped by any of user/account/partition.
+#   - GetRollup(): Returns usage summed over a date range, grouped by a user notes field (institution, pi, ...).
+#
+# Example:
+#   usage = EmpireUsage()
+#   for row in usage.GetRollup("2026-09-01", "2026-09-30", field="institution"):
+#       print(row["institution"], row["gpu_hours"])
+#
+# Requires the ijson package. Job records are parsed one at a time, so memory use does not grow with the number
+#   of jobs in a day, though each record (including its step data) is decoded in full while it is processed.
+#
+# Author: Kali McLennan (Flatiron Institute/Simons Foundation) - kmclennan@flatironinstitute.org
+
+import datetime
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from contextlib import contextmanager
+from pathlib import Path
+from EmPyreAI.EmpireSlurm import EmpireSlurm
+import EmPyreAI.EmpireNotesIndex as E_NotesIndex
+import EmPyreAI.EmpireUtils as EUtils
+
+GroupFields = ("user", "account", "partition")
+UsageColumns = ("jobs", "cpu_hours", "gpu_hours", "mem_gb_hours")
+
+def AsDate(value):
+    if isinstance(value, datetime.date):
+        return value
+    return datetime.date.fromisoformat(value)
+
+def DayBounds(day: datetime.date):
+    """Return the Unix timestamps of local midnight at the start and end of day."""
+    start = int(time.mktime(day.timetuple()))
+    return start, int(time.mktime((day + datetime.timedelta(days=1)).timetuple()))
+
+def TimeNumber(value):
+    if isinstance(value, dict): # v0.0.39 wraps some numbers as {"set": bool, "infinite": bool, "number": int}
+        return value.get("number") if value.get("set", True) else None
+    return value
+
+def AllocatedTres(job):
+    """Return (cpus, gpus, memory in MB) allocated to a slurmdb job record."""
+    cpus, memory, gpus, typedGpus = 0, 0, None, 0
+    tres = job.get("tres") or {}
+    for entry in tres.get("allocated") or ():
+        kind, name, count = entry.get("type"), entry.get("name") or "", entry.get("count") or 0
+        if kind == "cpu":
+            cpus = count
+        elif kind == "mem":
+            memory = count
+        elif kind == "gres" and name == "gpu":
+            gpus = count
+        elif kind == "gres" and name.startswith("gpu:"):
+            typedGpus += count
+    # Untyped gres/gpu already includes the typed counts; fall back to their sum if only typed entries were recorded
+    return cpus, typedGpus if gpus == None else gpus, memory
+
+class DailyUsage:
+    """Usage for one day, accumulated column-wise: row i of every column belongs to keys[i]."""
+    def __init__(self, day: datetime.date):
+        self.day = day
+        self.index = {} # (user, account, partition) -> row
+        self.keys = list()
+        self.jobs = array("l")
+        self.cpuHours = array("d")
+        self.gpuHours = array("d")
+        self.memGBHours = array("d")
+
+    def Add(self, key, hours: float, cpus, gpus, memory):
+        row = self.index.get(key)
+        if row == None:
+            row = self.index[key] = len(self.keys)
+            self.keys.append(key)
+            for column in (self.jobs, self.cpuHours, self.gpuHours, self.memGBHours):
+                column.append(0)
+        self.jobs[row] += 1
+        self.cpuHours[row] += hours * cpus
+        self.gpuHours[row] += hours * gpus
+        self.memGBHours[row] += hours * memory / 1024
+
+    def Rows(self):
+        day = self.day.isoformat()
+        return [(day,) + self.keys[i] + (self.jobs[i], self.cpuHours[i], self.gpuHours[i], self.memGBHours[i])
+                for i in range(len(self.keys))]
+
+class EmpireUsage:
+    def __init__(self, slurm = None, path: str = None):
+        self.slurm = EmpireSlurm() if slurm == None else slurm
+        if path == None:
+            path = f"{Path.home()}/.cache/EmPyreAI/usage_{self.slurm.config['apiServer']}.db"
+        self.path = path
+        self.lock = threading.RLock()
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if os.path.exists(path) == False:
+            os.close(os.open(path, os.O_WRONLY | os.O_CREAT, 0o600))
+        self.connection = sqlite3.connect(path, timeout=30, isolation_level=None, check_same_thread=False)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("""CREATE TABLE IF NOT EXISTS daily_usage (
+            day TEXT, user TEXT, account TEXT, partition TEXT, jobs INTEGER, cpu_hours REAL, gpu_hours REAL, mem_gb_hours REAL,
+            PRIMARY KEY (day, user, account, partition))""")
+        # A row per stored day, so days without any jobs are not fetched again either
+        self.connection.execute("CREATE TABLE IF NOT EXISTS days (day TEXT PRIMARY KEY, fetched_at INTEGER)")
+
+    @contextmanager
+    def Transaction(self):
+        with self.lock:
+            self.connection.execute("BEGIN IMMEDIATE")
+            try:
+                yield self.connection
+            except:
+                self.connection.execute("ROLLBACK")
+                raise
+            self.connection.execute("COMMIT")
+
+    #region Fetching
+    def Aggregate(self, day):
+        """Fetch every job that ran during day from slurmdb and return its usage as a DailyUsage, or None on failure."""
+        import ijson
+
+        day = AsDate(day)
+        dayStart, dayEnd = DayBounds(day)
+        now = int(time.time())
+        self.slurm.endpoint = self.slurm.endpoints["dbjobs"]
+        results = self.slurm.Get(f"?start_time={dayStart}&end_time={dayEnd}", stream=True)
+        if results == None or results.status_code != 200:
+            EUtils.Error(f"Unable to load job records for {day} from slurmdb (status {results.status_code if results != None else None}).")
+            return None
+
+        usage = DailyUsage(day)
+        try:
+            results.raw.decode_content = True
+            for job in ijson.items(results.raw, "jobs.item", use_float=True):
+                times = job.get("time") or {}
+                start = TimeNumber(times.get("start")) or 0
+                end = TimeNumber(times.get("end")) or now # Still running
+                seconds = min(end, dayEnd, now) - max(start, dayStart)
+                if start == 0 or seconds <= 0:
+                    continue # Never started, or did not run during this day
+                cpus, gpus, memory = AllocatedTres(job)
+                usage.Add((job.get("user") or "", job.get("account") or "", job.get("partition") or ""), seconds / 3600, cpus, gpus, memory)
+        except Exception as e:
+            EUtils.Error(f"Unable to read job records for {day} from slurmdb: {e}")
+            return None
+        finally:
+            results.close()
+        return usage
+
+    def GetStoredDays(self, first: datetime.date, last: datetime.date):
+        rows = self.connection.execute("SELECT day FROM days WHERE day BETWEEN ? AND ?", (first.isoformat(), last.isoformat())).fetchall()
+        return { row[0] for row in rows }
+
+    def Update(self, start, end):
+        """Fetch and store every complete day from start to end (inclusive) that is not stored yet. Returns the days fetched."""
+        first, last = AsDate(start), min(AsDate(end), datetime.date.today() - datetime.timedelta(days=1))
+        stored = self.GetStoredDays(first, last)
+        fetched = list()
+        day = first
+        while day <= last:
+            if day.isoformat() not in stored:
+                usage = self.Aggregate(day)
+                if usage == None:
+                    break # Leave the remaining days for the next report rather than storing a gap
+                with self.Transaction() as db:
+                    db.execute("DELETE FROM daily_usage WHERE day = ?", (day.isoformat(),))
+                    db.executemany("INSERT INTO daily_usage (day, user, account, partition, jobs, cpu_hours, gpu_hours, mem_gb_hours) "
+                                   "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", usage.Rows())
+                    db.execute("INSERT OR REPLACE INTO days (day, fetched_at) VALUES (?, ?)", (day.isoformat(), int(time.time())))
+                fetched.append(day)
+            day += datetime.timedelta(days=1)
+        return fetched
+    #endregion
+
+    #region Reports
+    def GetUsage(self, start, end, by = ("account",), update: bool = True):
+        """Return a list of dicts with jobs, cpu_hours, gpu_hours and mem_gb_hours summed over start..end (inclusive)
+        and grouped by the fields in by (any of user, account, partition), largest GPU usage first."""
+        by = tuple(by)
+        for field in by:
+            if field not in GroupFields:
+                raise ValueError(f"Usage can only be grouped by {', '.join(GroupFields)}, not {field}.")
+        first, last = AsDate(start), AsDate(end)
+        if last >= datetime.date.today():
+            EUtils.Warning("Usage reports only include complete days; today and later are left out.")
+        if update:
+            self.Update(first, last)
+
+        groupBy = ", ".join(by)
+        columns = (groupBy + ", " if len(by) > 0 else "") + "SUM(jobs), SUM(cpu_hours), SUM(gpu_hours), SUM(mem_gb_hours)"
+        query = f"SELECT {columns} FROM daily_usage WHERE day BETWEEN ? AND ?"
+        if len(by) > 0:
+            query += f" GROUP BY {groupBy}"
+        query += " ORDER BY SUM(gpu_hours) DESC"
+        with self.lock:
+            rows = self.connection.execute(query, (first.isoformat(), last.isoformat())).fetchall()
+        return [dict(zip(by + UsageColumns, row)) for row in rows if row[len(by)] != None]
+
+    def GetRollup(self, start, end, field: str = "institution", update: bool = True):
+        """Return usage over start..end grouped by a user notes field (ex. institution, pi). Values are matched the
+        way EmpireNotesIndex matches them (case and surrounding whitespace ignored); each group is labelled with the
+        spelling used by its largest GPU user. Users without the field are grouped under None."""
+        if field not in E_NotesIndex.EmpireNotesIndex.Fields:
+            raise ValueError(f"Rollups can only use indexed notes fields: {', '.join(E_NotesIndex.EmpireNotesIndex.Fields)}.")
+        index = E_NotesIndex.GetIndex()
+        totals = {}
+        for row in self.GetUsage(start, end, by=("user",), update=update):
+            value = index.GetValues(row["user"]).get(field)
+            key = None if value == None else E_NotesIndex.EmpireNotesIndex.Normalize(value)
+            if key == "":
+                key = None
+            if key not in totals:
+                label = None if key == None else str(value).strip()
+                totals[key] = { field: label, "users": 0, "jobs": 0, "cpu_hours": 0.0, "gpu_hours": 0.0, "mem_gb_hours": 0.0 }
+            total = totals[key]
+            total["users"] += 1
+            for column in UsageColumns:
+                total[column] += row[column]
+        return sorted(totals.values(), key=lambda total: total["gpu_hours"], reverse=True)
+    #endregion
@@ -19,12 +19,15 @@
 #
 # Static Functions:
 #   - Exists(): Returns bool. True if the user exists, False if it does not.
+#   - GetAll(): Returns a generator of EmpireUserRecord objects holding only the requested fields.
+#   - LoadMany(): Returns (dict, list). Loads many users in one pass and reports the usernames that do not exist.
 #
 # Class Functions:
 #   - GetFromCMD(): Loads user data from the Base Command API into the user_data variable. Returns (bool)
 #   - Commit(): Commits changes of user information to the Base Command API. Returns (bool).
 #   - SetUserData(): Accepts a dictionary and makes a bulk commit to Base Command without confirmation. Returns (bool).
 #   - AppendNote(): Adds a new key to the notes property. Returns (bool).
+#   - FlushNotes(): Serializes the cached notes dict into the pythoncm User if it has changed. Called by Commit().
 #  
 # This makes use of the EmPyreAI module and ultimately the Base Command API
 #   to provide user management capabilities to coordinators without requiring
@@ -34,11 +37,33 @@
 
 import EmPyreAI.EmpireAPI as E_API
 import EmPyreAI.EmpireUtils as E_Utils
+import EmPyreAI.EmpireMembership as E_Membership
+import EmPyreAI.EmpireNotesIndex as E_NotesIndex
 from pythoncm.entity import User
 import getpass
 from datetime import datetime
 import json
-import re
+
+class EmpireUserRecord:
+    """Read-only projection of a pythoncm User produced by EmpireUser.GetAll(). Unrequested fields are None."""
+    Fields = ("name", "uid", "email", "firstname", "lastname", "notes")
+    __slots__ = Fields
+
+    def __init__(self, userData, fields = Fields):
+        self.name = userData.name if "name" in fields else None
+        self.uid = userData.ID if "uid" in fields else None
+        self.email = userData.email if "email" in fields else None
+        self.firstname = userData.commonName if "firstname" in fields else None
+        self.lastname = userData.surname if "lastname" in fields else None
+        self.notes = None
+        if "notes" in fields:
+            try:
+                self.notes = json.loads(userData.notes) if userData.notes else {}
+            except ValueError:
+                self.notes = { "other": userData.notes }
+
+    def __repr__(self):
+        return f"EmpireUserRecord({self.name})"
 
 class EmpireUser:
     @staticmethod
@@ -51,7 +76,7 @@ class EmpireUser:
           - True if the user exists
           - False if the user does not exist
         """
-        user_data = E_API.CMSH_Cluster.get_by_name(username, 'User') # Ask BaseCommand for the User object with the supplied username
+        user_data = E_API.GetByName(username, 'User') # Ask BaseCommand for the User object with the supplied username
         if user_data == None:
             return False
         return True
@@ -59,7 +84,9 @@ class EmpireUser:
 #region Static Methods
     @staticmethod
     def New(username: str):
-        retVal = User(E_API.CMSH_Cluster)
+        if E_API.IsReadOnly():
+            raise E_API.ReadOnlyError(f"Cannot create the user {username} while reading from a read-only directory snapshot.")
+        retVal = User(E_API.GetCluster())
         retVal.name = username
         retVal.password = E_Utils.GenPassword(28)
         retVal.homeDirectory = f"/mnt/home/{username}"
@@ -68,27 +95,87 @@ class EmpireUser:
         retVal.notes = f'{ "created_by": "{getpass.getuser()}", "created_at": "{creationTime}"}'
         return retVal
     
-    def GetAll():
-        retVal = list()
-        print(E_API.CMSH_Cluster.entities)
+    @staticmethod
+    def LoadMany(usernames, createMissing: bool = False):
+        """Resolve many users with a single pass over the cluster's User entities.
+        Input:
+          - usernames: iterable of usernames
+          - createMissing: if True, new uncommitted EmpireUser objects are returned for missing names
+                           (ignored in snapshot mode, where missing users are only reported)
+        Return:
+          - (users, missing): a dict of username -> EmpireUser and a list of usernames that do not exist
+        """
+        wanted = list(dict.fromkeys(usernames)) # De-duplicate while preserving order
+        wantedSet = set(wanted)
+        found = {}
+        for userData in E_API.GetAll('User'):
+            if userData.name in wantedSet:
+                found[userData.name] = userData
+
+        users = {}
+        missing = list()
+        for username in wanted:
+            if username in found:
+                users[username] = EmpireUser(username, userData=found[username])
+            else:
+                missing.append(username)
+                if createMissing and E_API.IsReadOnly() == False:
+                    newUser = EmpireUser.__new__(EmpireUser)
+                    newUser.InitNew(username)
+                    users[username] = newUser
+        return users, missing
+
+    @staticmethod
+    def GetAll(fields = ("name", "uid", "email", "notes")):
+        """Iterate over every user in Base Command, yielding a lightweight EmpireUserRecord per user.
+        Input:
+          - fields: which of EmpireUserRecord.Fields to populate. Notes are only decoded if "notes" is requested.
+        Return:
+          - generator of EmpireUserRecord
+        """
+        for field in fields:
+            if field not in EmpireUserRecord.Fields:
+                raise ValueError(f"Unknown user field {field}. Valid fields are: {', '.join(EmpireUserRecord.Fields)}")
+        fields = frozenset(fields)
+        for userData in E_API.GetAll('User'):
+            yield EmpireUserRecord(userData, fields)
 #endregion
 
 #region Constructor
-    def __init__(self, username: str):
-        if EmpireUser.Exists(username) == True:
-            self.UserData = E_API.CMSH_Cluster.get_by_name(username, 'User')
+    def __init__(self, username: str, userData = None):
+        """Load the user from Base Command, or start a new uncommitted user if it does not exist.
+        Input:
+          - username: string
+          - userData: an already fetched pythoncm User entity. When supplied no lookup is made.
+        """
+        if userData == None:
+            userData = E_API.GetByName(username, 'User') # Single round trip; None means the user does not exist
+        if userData != None:
+            self.UserData = userData
             self.Committed = True
+            self.NotesCache = None # Decoded lazily, once, by GetNotes()
+            self.NotesDirty = False
+        elif E_API.IsReadOnly():
+            raise E_API.ReadOnlyError(f"The user {username} does not exist in the directory snapshot, and new users cannot be created from a read-only snapshot.")
         else:
             E_Utils.Warning(f"A request was made to load user data from CMSH for username {username} but this user does not exist. Creating a new user.")
-            self.UserData = User(E_API.CMSH_Cluster)
-            self.UserData.name = username
-            self.UserData.homeDirectory = f"/mnt/home/{username}"
-            self.UserData.loginShell = "/bin/bash"
-            creationData = {}
-            creationData["created_by"] = getpass.getuser()
-            creationData["created_at"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-            self.UserData.notes = json.dumps(creationData)
-            self.Committed = False     
+            self.InitNew(username)
+
+    def InitNew(self, username: str):
+        """Populate this instance as a brand new, uncommitted user. Raises EmpireAPI.ReadOnlyError in snapshot mode."""
+        if E_API.IsReadOnly():
+            raise E_API.ReadOnlyError(f"Cannot create the user {username} while reading from a read-only directory snapshot.")
+        self.UserData = User(E_API.GetCluster())
+        self.UserData.name = username
+        self.UserData.homeDirectory = f"/mnt/home/{username}"
+        self.UserData.loginShell = "/bin/bash"
+        creationData = {}
+        creationData["created_by"] = getpass.getuser()
+        creationData["created_at"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        self.UserData.notes = json.dumps(creationData)
+        self.Committed = False
+        self.NotesCache = creationData
+        self.NotesDirty = False
 #endregion
 
 #region Class Methods
@@ -116,13 +203,13 @@ class EmpireUser:
             E_Utils.Error(f"Attempting to commit a user object that has no email defined. Aborting!")
             return False
         
-        notes = self.Notes
-        notes["last_modified_by"] = getpass.getuser() # Store who committed the last change to this object
-        notes["last_modified"] = datetime.now().strftime("%Y-%m-%d %H:%M:%S") # Store the current time as the last modification time
-        self.Notes = notes
-        result = self.UserData.commit()
+        self.SetNote("last_modified_by", getpass.getuser()) # Store who committed the last change to this object
+        self.SetNote("last_modified", datetime.now().strftime("%Y-%m-%d %H:%M:%S")) # Store the current time as the last modification time
+        self.FlushNotes()
+        result = E_API.Commit(self.UserData, 'User')
         if result.good:
             self.Committed = True
+            E_NotesIndex.NotifyCommit(self.Username, self.Notes)
             return True
         return False
     
@@ -149,36 +236,42 @@ class EmpireUser:
           - None
         """
         notes = self.Notes
+        if key in notes and notes[key] == value:
+            return # Nothing changed, leave the notes clean
         notes[key] = value
-        self.Notes = notes
+        self.NotesDirty = True
+        self.Committed = False
 
-    def SendWelcomeEmail(self):
-        import smtplib
-        from email.mime.text import MIMEText
-        from email.mime.multipart import MIMEMultipart
-        import jinja2
-
-        environment = jinja2.Environment(loader=jinja2.FileSystemLoader("/opt/EmpireAI-Tools/templates"))
-        template = environment.get_template("new_user_email.template")
-        content = template.render(firstname=self.FirstName, username=self.Username, institution=self.Institution)
-        smtp_server = "alpha-mgr"
-        smtp_port = 25
-        from_email = "help@empire-ai.org"
-        to_email = self.Email
-        subject = "Empire AI Alpha Account Creation Notice"
-
-        message = MIMEMultipart("alternative")
-        message["From"] = from_email
-        message["To"] = to_email
-        message["Subject"] = subject
-        mime_text = MIMEText(content, "html")
-        message.attach(mime_text)
+    AppendNote = SetNote
+
+    def FlushNotes(self):
+        """Serialize the cached notes dict back into UserData.notes, but only if it has changed since it was loaded.
+        Input:
+          - None
+        Return:
+          - None
+        """
+        if self.NotesDirty == False:
+            return
         try:
-            with smtplib.SMTP(smtp_server, smtp_port) as server:
-                server.sendmail(from_email, to_email, message.as_string())
-            print(f"[\033[32m SUCCESS\033[0m ] Sent a welcome email to {self.Email}.")
+            self.UserData.notes = json.dumps(self.NotesCache)
         except Exception as e:
-            print(f"[\033[31m ERROR\033[0m ] Failed to send a welcome email to {self.Email}. Error details: {e}.")
+            E_Utils.Error("Failed to encode notes value as a JSON string. Recovering existing note data in the 'other' key.")
+            self.NotesCache = { "other": str(self.NotesCache) }
+            self.UserData.notes = json.dumps(self.NotesCache)
+        self.NotesDirty = False
+
+    def SendWelcomeEmail(self):
+        """Send the welcome email using the shared mailer (cached template, reused SMTP session).
+        Use EmpireMail.GetMailer().SendWelcomeEmails() to send many at once."""
+        from EmPyreAI.EmpireMail import GetMailer
+
+        result = GetMailer().SendWelcomeEmails([self])[0]
+        if result["sent"]:
+            print(f"[\033[32m SUCCESS\033[0m ] Sent a welcome email to {self.Email}.")
+        else:
+            print(f"[\033[31m ERROR\033[0m ] Failed to send a welcome email to {self.Email}. Error details: {result['message']}.")
+        return result["sent"]
 #endregion 
 
 #region Class Properties (Getters and Setters)
@@ -207,7 +300,7 @@ class EmpireUser:
     Institution = property(GetInstitution, SetInstitution)
 
     def GetPI(self):
-        notes = self.notes
+        notes = self.Notes
         if "pi" in notes.keys():
             return notes["pi"]
         return None
@@ -255,8 +348,7 @@ class EmpireUser:
         return self.UserData.email
     
     def SetEmail(self, value):
-        email_regex = r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,7}\b'
-        if (re.fullmatch(email_regex, value)):
+        if E_Utils.ValidEmail(value):
             self.UserData.email = value
             self.Committed = False
         else:
@@ -265,45 +357,38 @@ class EmpireUser:
     Email = property(GetEmail, SetEmail)
 
     def GetGroups(self):
-        import grp, pwd
-        retVal = [g.gr_name for g in grp.getgrall() if self.Username in g.gr_mem]
-        gid = pwd.getpwnam(self.Username).pw_gid
-        retVal.append(grp.getgrgid(gid).gr_name)
-        return retVal
+        return sorted(E_Membership.GetIndex().GetGroups(self.Username))
     
     Groups = property(GetGroups)
 
     def GetNotes(self):
-        """Convert the User.notes field from pythoncm form JSON to a Python dict object and return it."""
+        """Return the User.notes field as a Python dict. The JSON is decoded once and the same dict is edited in place
+        until FlushNotes() writes it back at Commit()."""
+        if self.NotesCache != None:
+            return self.NotesCache
+
         if self.UserData.notes != None and len(self.UserData.notes) > 0:
             try:
-                return json.loads(self.UserData.notes) # Attempt to decode the UserData.notes field from JSON to a dict and return it           
+                self.NotesCache = json.loads(self.UserData.notes) # Attempt to decode the UserData.notes field from JSON to a dict
             except Exception as e:
                 # If unable to decode UserData.notes as JSON then create a new dict and set the 'other' key to the existing notes for this user.
-                E_Utils.Error(f"Unable to decode notes for the user {self.username}. Adding any existing notes as the 'other' key and returning a valid data structure.")
-                userNotes = {}
-                userNotes["other"] = self.UserData.notes
-                self.UserData.notes = json.dumps(userNotes)
-                self.Commtted = False
-                return userNotes
+                E_Utils.Error(f"Unable to decode notes for the user {self.Username}. Adding any existing notes as the 'other' key and returning a valid data structure.")
+                self.NotesCache = { "other": self.UserData.notes }
+                self.NotesDirty = True
+                self.Committed = False
         else:
-            self.UserData.notes = "{}"
+            self.NotesCache = {} # Start from an empty dict
+            self.NotesDirty = True
             self.Committed = False
-            return {} # Return an empty dict
+        return self.NotesCache
 
     def SetNotes(self, notesDict):
-        try:
-            self.UserData.notes = json.dumps(notesDict)
-            self.Committed = False
-        except Exception as e:
-            E_Utils.Error("Failed to encode notes value as a JSON string. Recovering existing note data in the 'other' key.")
-            newNotes = {}
-            newNotes["other"] = str(notesDict)
-            self.UserData.notes = json.dumps(newNotes)
-            self.Committed = False
-    
+        self.NotesCache = notesDict
+        self.NotesDirty = True
+        self.Committed = False
     
     Notes = property(GetNotes, SetNotes)
+    notes = property(GetNotes, SetNotes)
 
     def GetHomeDirectory(self):
         return self.UserData.homeDirectory
@@ -324,39 +409,29 @@ class EmpireUser:
     Shell = property(GetShell, SetShell)
 
     def GetLastModified(self):
-        if "last_modified" in self.Notes.keys() and "last_modified_by" in self.Notes.keys():
-            retVal = {}
-            retVal["date"] = self.Notes["last_modified"]
-            retVal["by"] = self.Notes["last_modified_by"]
-            return retVal
-        else:
+        notes = self.Notes
+        if "last_modified" not in notes.keys() or "last_modified_by" not in notes.keys():
             E_Utils.Warning("Last modification information is missing. Populating it now.")
             self.SetNote(key="last_modified", value=datetime.now().strftime("%Y-%m-%d %H:%M:%S"))
             self.SetNote(key="last_modified_by", value=getpass.getuser())
-            self.Committed = False
-            retVal = {}
-            retVal["date"] = self.Notes["last_modified"]
-            retVal["by"] = self.Notes["last_modified_by"]
-            return retVal
+        retVal = {}
+        retVal["date"] = notes["last_modified"]
+        retVal["by"] = notes["last_modified_by"]
+        return retVal
         
     LastModified = property(GetLastModified)
 
     def GetCreation(self):
-        if "created_at" in self.Notes.keys() and "created_by" in self.Notes.keys():
-            retVal = {}
-            retVal["date"] = self.Notes["created_at"]
-            retVal["by"] = self.Notes["created_by"]
-            return retVal
-        else:
+        notes = self.Notes
+        if "created_at" not in notes.keys() or "created_by" not in notes.keys():
             E_Utils.Warning("Creation information is missing. Populating it now.")
             self.SetNote(key="created_at", value="2024-01-01 00:00:00")
             self.SetNote(key="created_by", value="unknown")
-            self.Committed = False
-            retVal = {}
-            retVal["date"] = self.Notes["created_at"]
-            retVal["by"] = self.Notes["created_by"]
-            return retVal
-            
+        retVal = {}
+        retVal["date"] = notes["created_at"]
+        retVal["by"] = notes["created_by"]
+        return retVal
+        
     Creation = property(GetCreation)
 
 #endregion
\ No newline at end of file
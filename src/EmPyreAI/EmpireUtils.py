@@ -5,6 +5,10 @@ import sys
 import re
 
 MinimumUsernameLength = 4
+EmailRegex = r'\b[A-Za-z0-9._%+-]+@[A-Za-z0-9.-]+\.[A-Z|a-z]{2,7}\b'
+
+def ValidEmail(email):
+    return email != None and re.fullmatch(EmailRegex, email) != None
 
 def FormatPhoneNumber(phone):
     # Remove non-digit characters